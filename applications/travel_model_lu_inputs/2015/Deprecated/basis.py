@@ -4,12 +4,15 @@ import glob
 import os
 import zipfile
 import geopandas as gpd
+import numpy as np
 import pandas as pd
-from shapely.wkt import loads
+import shapely
 
 
-cities_and_counties = yaml.load(open("zones/cities_and_counties.yaml"))
+cities_and_counties = yaml.safe_load(open("zones/cities_and_counties.yaml"))
 cities = set(sum(cities_and_counties.values(), []))
+# merged general plan data, with geometry stored as WKB
+MERGED_GP_FILE = "output/merged_general_plan_data.parquet"
 abbreviations = {
     "alameda": "ala",
     "contra_costa": "con",
@@ -34,8 +37,8 @@ def get_city_from_gp_path(path):
     city = file.replace("_general_plan.geojson", "").\
         replace("_plu.geojson", "")
     if city not in cities:
-        print "Path not parsed correctly"
-        print path, city
+        print("Path not parsed correctly")
+        print(path, city)
         assert city in cities
     city = city.replace('_', ' ').title()
     return city
@@ -46,7 +49,7 @@ def merge_gp_spatial_data(cities_and_counties, path="policies/plu/*.geojson"):
     gdfs = []
     for geojson in glob.glob(path):
         city = get_city_from_gp_path(geojson)
-        print geojson
+        print(geojson)
         gdf = gpd.GeoDataFrame.from_file(geojson)
         gdf["city"] = city
         gdf["priority"] = 2 if "plu" in os.path.split(geojson)[1] else 1
@@ -58,7 +61,7 @@ def merge_gp_spatial_data(cities_and_counties, path="policies/plu/*.geojson"):
 # we store general plan data in a set of shapefiles and zoning attributes in
 # a csv this method tells us which join keys are missing from each dataset
 def diagnose_merge(df, gdf):
-    print "Number of records in zoning data that have a shape to join to:"
+    print("Number of records in zoning data that have a shape to join to:")
     df["zoning_id"] = df.id  # need to rename so names don't clash in merge
 
     df2 = pd.merge(df, gdf,
@@ -66,52 +69,79 @@ def diagnose_merge(df, gdf):
                    right_on=["city", "general_plan_name"])
 
     missing = df[~df.zoning_id.isin(df2.zoning_id)]
-    print "{} missing zoning ids (data written to missing_zoning_ids.csv".\
-        format(len(missing))
+    print("{} missing zoning ids (data written to missing_zoning_ids.csv".
+          format(len(missing)))
     missing.to_csv("missing_zoning_ids.csv", index=False)
 
 
-# pass in a shapefile of general plan data and join in to each county
-# shapefile in turn
-def merge_parcels_and_gp_data(gp_data):
-    joined_counties = []
-    for county in cities_and_counties.keys():
-        print "Joining parcels to general plan data for {}".format(county)
-
+# read the parcel centroids for all counties, with parcel_id
+def read_parcel_centroids(counties):
+    parcels = []
+    for county in counties:
         geopath = "basemap/2010/parcels/{}_parcels.shp".format(county)
         if not os.path.exists(geopath):
-            unzip_file(geopath.replace("shp", "zip"), "basemap/parcels/2010")
-
-        parcels = gpd.GeoDataFrame.from_file(geopath)
-        parcels.crs = {'init': u'epsg:4326'}
-        parcels["parcel_id"] = [abbreviations[county] + str(v+1)
-                                for v in parcels.index.values]
-        parcels["geometry"] = parcels.centroid
-        print "  joining {} rows".format(len(parcels))
-
-        print "Joining to TAZs"
-        zones = gpd.GeoDataFrame.from_file("zones/travel/tazs.json")
-        zones.crs = {'init': u'epsg:4326'}
-        zones["zone_id"] = zones.ZONE_ID
-        ret = gpd.sjoin(parcels, zones, how="left", op="within")
-        # just keep the columns that we had before plus zone_id
-        # spatial join in the next step was breaking otherwise
-        ret = ret[list(parcels.columns) + ["zone_id"]]
-
-        print "Joining to GP data"
-        ret = gpd.sjoin(ret, gp_data, how="left", op="within")
-
-        # sort by prioity and drop duplicates, 1 priority is higher than 2 etc
-        ret = ret.sort_values("priority").drop_duplicates(subset=["parcel_id"])
-        ret = gpd.GeoDataFrame(ret)  # make spatial again
-
-        ret["x"] = [shp.x for shp in ret.geometry]
-        ret["y"] = [shp.y for shp in ret.geometry]
-
-        ret = ret.drop(["geometry", "id", "index_right"], axis=1)
-        joined_counties.append(ret)
-
-    return pd.concat(joined_counties)
+            unzip_file(geopath.replace("shp", "zip"), os.path.dirname(geopath))
+
+        county_parcels = gpd.read_file(geopath)
+        county_parcels = county_parcels.set_crs(epsg=4326, allow_override=True)
+        county_parcels["parcel_id"] = abbreviations[county] + \
+            pd.Series(np.arange(1, len(county_parcels)+1), index=county_parcels.index).astype(str)
+        county_parcels["geometry"] = county_parcels.centroid
+        print("Read {} parcels for {}".format(len(county_parcels), county))
+        parcels.append(county_parcels)
+
+    return gpd.GeoDataFrame(pd.concat(parcels, ignore_index=True), crs="EPSG:4326")
+
+
+# returns the index of the polygon containing each point, or -1; where
+# several do, the one with the lowest rank (e.g. priority) wins, then the
+# first polygon
+def points_within(points, polygons, rank=None):
+    within = np.full(len(points), -1, dtype=np.int64)
+    tree = shapely.STRtree(polygons)
+    point_idx, polygon_idx = tree.query(points, predicate="within")
+    if len(point_idx) == 0:
+        return within
+
+    rank = np.zeros(len(polygons)) if rank is None else np.asarray(rank)
+    order = np.lexsort((polygon_idx, rank[polygon_idx], point_idx))
+    point_idx, polygon_idx = point_idx[order], polygon_idx[order]
+    first = np.r_[True, point_idx[1:] != point_idx[:-1]]
+    within[point_idx[first]] = polygon_idx[first]
+    return within
+
+
+# pass in a geodataframe of general plan data and join it to the parcels of
+# all counties at once: parcel centroids are located in the TAZ and general
+# plan polygons with STRtree queries, built once
+def merge_parcels_and_gp_data(gp_data, zones_path="zones/travel/tazs.json"):
+    print("Joining parcels to general plan data")
+    parcels = read_parcel_centroids(list(cities_and_counties.keys()))
+    points = parcels.geometry.values
+    print("  joining {} rows".format(len(parcels)))
+
+    print("Joining to TAZs")
+    zones = gpd.read_file(zones_path).set_crs(epsg=4326, allow_override=True)
+    zone_idx = points_within(points, zones.geometry.values)
+    parcels["zone_id"] = zones.ZONE_ID.to_numpy()[zone_idx].astype(float)
+    parcels.loc[zone_idx < 0, "zone_id"] = np.nan
+
+    print("Joining to GP data")
+    # 1 priority is higher than 2 etc
+    gp_data = gp_data.reset_index(drop=True)
+    gp_idx = points_within(points, gp_data.geometry.values,
+                           rank=gp_data.priority.to_numpy())
+    gp_attributes = gp_data.drop(columns=["geometry", "id"], errors="ignore")
+    # parcels outside the general plan polygons (-1) get NaN attributes
+    gp_attributes = gp_attributes.reindex(gp_idx)
+    gp_attributes.index = parcels.index
+    gp_attributes = gp_attributes.drop(columns=[col for col in gp_attributes.columns
+                                                if col in parcels.columns])
+
+    ret = pd.concat([pd.DataFrame(parcels.drop(columns="geometry")), gp_attributes], axis=1)
+    ret["x"] = shapely.get_x(points)
+    ret["y"] = shapely.get_y(points)
+    return ret.drop(columns=["id"], errors="ignore")
 
 
 parser = argparse.ArgumentParser(description='Run Bay Area data script.')
@@ -124,22 +154,24 @@ options = parser.parse_args()
 MODE = options.mode
 
 if MODE == "merge_gp_data":
-    print "Reading geojson data by juris"
+    print("Reading geojson data by juris")
     gdf = merge_gp_spatial_data(cities_and_counties)
-    print "Writing general plan data as csvfile"
-    # writing to csv makes reading the attributes in very fast
-    # shapefiles take a long time to read in python
-    gdf.to_csv("output/merged_general_plan_data.csv", index=False)
+    print("Writing general plan data as geoparquet")
+    # shapefiles take a long time to read in python; geoparquet reads the
+    # attributes as fast as a csv and decodes the WKB geometry vectorized
+    gdf = gdf.set_crs(epsg=4326, allow_override=True).reset_index(drop=True)
+    # the city files have different schemas, so a column can be numeric in
+    # one and text in another; parquet needs one type, so text columns are
+    # written as strings (nulls kept)
+    for col in gdf.columns:
+        if col != gdf.geometry.name and gdf[col].dtype == object:
+            gdf[col] = gdf[col].astype(str).where(gdf[col].notnull())
+    gdf.to_parquet(MERGED_GP_FILE, index=False)
 
 elif MODE == "merge_parcels_and_gp_data":
-    print "Merging parcels and general plan data"
-    df = pd.read_csv("output/merged_general_plan_data.csv")
-    print "Converting geocsv"
-    # convert shapes from text
-    df["geometry"] = [loads(shp) for shp in df.geometry]
-    gdf = gpd.GeoDataFrame(df)
-    gdf.crs = {'init': u'epsg:4326'}
-    print "Converted geocsv to geodataframe"
+    print("Merging parcels and general plan data")
+    gdf = gpd.read_parquet(MERGED_GP_FILE)
+    print("Read {} general plan shapes from {}".format(len(gdf), MERGED_GP_FILE))
     df = merge_parcels_and_gp_data(gdf)
     df.to_csv("output/parcels_joined_to_general_plans.csv", index=False)
 
@@ -147,8 +179,9 @@ elif MODE == "merge_parcels_and_gp_data":
     #     grp.to_csv("output/taz{}_zoning.csv".format(int(name)), index=False)
 
 elif MODE == "diagnose_merge":
-    print "Reading gp data"
-    gdf = pd.read_csv("output/merged_general_plan_data.csv")
+    print("Reading gp data")
+    # attributes only
+    gdf = pd.read_parquet(MERGED_GP_FILE, columns=["city", "general_plan_name"])
     df = pd.read_csv("zoning_lookup.csv")
     # this file is not in this repo - it should be copied from the
     # bayarea_urbansim repo soon we will generate a new zoning-parcel
@@ -160,4 +193,4 @@ elif MODE == "diagnose_merge":
     diagnose_merge(df, gdf)
 
 else:
-    print "Must pick a mode.  Options include merge_gp_data, diagnose_merge..."
+    print("Must pick a mode.  Options include merge_gp_data, diagnose_merge...")
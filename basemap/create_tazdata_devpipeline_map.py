@@ -16,9 +16,11 @@
 # for arcpy:
 # set PATH=C:\Program Files\ArcGIS\Pro\bin\Python\envs\arcgispro-py3
 
-import logging,os,re,sys,time
+import logging,os,re,time
 import numpy, pandas
 
+from h5_store import current_manifest_entry
+
 NOW = time.strftime("%Y%b%d.%H%M")
 
 # taz-county file
@@ -43,6 +45,8 @@ if os.getenv("USERNAME")=="lzorn":
     # employment data
     EMPLOYMENT_FILE       = "X:\\petrale\\applications\\travel_model_lu_inputs\\2015\\TAZ1454 2015 Land Use.csv"
     OUTPUT_DIR            = os.path.join(URBANSIM_LOCAL_DIR, "map_data")
+    # basemap tables cached by content hash (see read_basemap_table)
+    BASEMAP_CACHE_DIR     = os.path.join(URBANSIM_LOCAL_DIR, "basemap_cache")
     LOG_FILE              = os.path.join(OUTPUT_DIR, "create_tazdata_devpipeline_map_{}.log".format(NOW))
 
     # building types
@@ -103,6 +107,31 @@ def set_year_built_category(df):
 
     return df
 
+def read_basemap_table(basemap_file, key, cache_dir, logger):
+    """
+    Read key from the basemap h5. If the store manifest has a current entry for the table (see h5_store.py), the table
+    is cached in cache_dir as parquet keyed on its hash (of schema and content), so later runs on the same table read
+    the cache.
+    Returns (dataframe, cached) where cached is True if the table came from the cache (and so was checked before).
+    """
+    entry = current_manifest_entry(basemap_file, key)
+    if entry is None:
+        logger.info("{} has no current manifest entry for {}; reading it without caching".format(basemap_file, key))
+        return pandas.read_hdf(basemap_file, key=key), False
+
+    logger.info("{} {}: {:,} rows from {}, hash {}".format(basemap_file, key, entry['rows'],
+                (entry['source'] or {}).get('file'), entry['hash']))
+    cache_file = os.path.join(cache_dir, "{}_{}.parquet".format(key, entry['hash'][:16]))
+    if os.path.exists(cache_file):
+        logger.info("Reading cached {}".format(cache_file))
+        return pandas.read_parquet(cache_file), True
+
+    df = pandas.read_hdf(basemap_file, key=key)
+    if not os.path.exists(cache_dir): os.makedirs(cache_dir)
+    df.to_parquet(cache_file)
+    logger.info("Cached {} as {}".format(key, cache_file))
+    return df, False
+
 def warn_zone_county_disagreement(df):
     # check if zone/county mapping disagree with the TM mapping and log issues
     # TODO
@@ -166,7 +195,7 @@ if __name__ == '__main__':
     logger.info("Reading parcels and buildings from {}".format(os.path.join(URBANSIM_LOCAL_DIR, URBANSIM_BASEMAP_FILE)))
 
     # use this for parcel_id (index), county_id, zone_id, acres
-    parcels_df   = pandas.read_hdf(os.path.join(URBANSIM_LOCAL_DIR, URBANSIM_BASEMAP_FILE), key='parcels')
+    parcels_df, _ = read_basemap_table(os.path.join(URBANSIM_LOCAL_DIR, URBANSIM_BASEMAP_FILE), 'parcels', BASEMAP_CACHE_DIR, logger)
     # logger.info(parcels_df.dtypes)
     parcels_df = parcels_df[["zone_id","acres"]].reset_index().rename(columns={"acres":"parcel_acres"})
     logger.info("parcels_df.head():\n{}".format(parcels_df.head()))
@@ -175,7 +204,7 @@ if __name__ == '__main__':
     parcels_zone_df = parcels_df.groupby(["zone_id"]).agg({"parcel_acres":"sum"}).reset_index()
     logger.info("parcels_zone_df:\n{}".format(parcels_zone_df.head()))
 
-    buildings_df = pandas.read_hdf(os.path.join(URBANSIM_LOCAL_DIR, URBANSIM_BASEMAP_FILE), key='buildings')
+    buildings_df, buildings_cached = read_basemap_table(os.path.join(URBANSIM_LOCAL_DIR, URBANSIM_BASEMAP_FILE), 'buildings', BASEMAP_CACHE_DIR, logger)
     logger.info("buildings_df.dtypes:\n{}".format(buildings_df.dtypes))
     #logger.info(buildings_df.head())
 
@@ -187,17 +216,21 @@ if __name__ == '__main__':
     buildings_df = pandas.merge(left=buildings_df, right=parcels_df[["parcel_id","zone_id"]], 
                                 how="left", left_on=["parcel_id"], right_on=["parcel_id"])
 
-    buildings_no_year_built = buildings_df.loc[pandas.isnull(buildings_df.year_built)]
-    if len(buildings_no_year_built) > 0:
-        logger.warn("buildings_df has {} rows with no year_built:\n{}".format(len(buildings_no_year_built), buildings_no_year_built))
-    else:
-        logger.info("buildings_df has 0 rows with no year_built")
-
-    buildings_no_building_type = buildings_df.loc[pandas.isnull(buildings_df.building_type)]
-    if len(buildings_no_building_type) > 0:
-        logger.warn("buildings_df has {} rows with no building_type:\n{}".format(len(buildings_no_building_type), buildings_no_building_type))
+    # buildings read from the cache were checked when the cache was written
+    if buildings_cached:
+        logger.info("buildings_df is unchanged since cached; skipping year_built and building_type checks")
     else:
-        logger.info("buildings_df has 0 rows with no building_type")
+        buildings_no_year_built = buildings_df.loc[pandas.isnull(buildings_df.year_built)]
+        if len(buildings_no_year_built) > 0:
+            logger.warn("buildings_df has {} rows with no year_built:\n{}".format(len(buildings_no_year_built), buildings_no_year_built))
+        else:
+            logger.info("buildings_df has 0 rows with no year_built")
+
+        buildings_no_building_type = buildings_df.loc[pandas.isnull(buildings_df.building_type)]
+        if len(buildings_no_building_type) > 0:
+            logger.warn("buildings_df has {} rows with no building_type:\n{}".format(len(buildings_no_building_type), buildings_no_building_type))
+        else:
+            logger.info("buildings_df has 0 rows with no building_type")
 
     #### sum to zone by year_built_category and building_type: residential_units, residential_sqft, non_residential_sqft
     buildings_zone_btype_df = buildings_df.groupby(["zone_id","year_built_category_agg","year_built_category","building_type"]).agg(
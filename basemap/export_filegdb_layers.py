@@ -1,71 +1,278 @@
 USAGE = """
-  Pass in a file geodatabase and layer name and this will export into the current working directory:
+  Pass in a file geodatabase and layer name and this will export into the output directory (default: current working directory):
 
-  1) a shapefile if the layer is a feature class
-  2) a dbf if the layer is a table
+  1) csv        - attributes only
+  2) geojson    - newline-delimited GeoJSON features (one feature per line), for feature classes
+  3) parquet    - attributes only
+  4) geoparquet - attributes plus geometry as WKB, with GeoParquet metadata, for feature classes
 
-  To see a list of the feature classes and/or tables, pass the geodatabase name only.
+  To see a list of the feature classes and tables, pass the geodatabase name only.
+  --inventory writes the list, with row counts and fields of each layer, as [geodatabase]_inventory.json.
+  --all exports every layer (or those matching --layer_pattern, e.g. "p10*") concurrently with --workers processes;
+  tables are written as csv for --format geojson and as parquet for --format geoparquet.
 
-Use ArcGIS python for arcpy
-set PATH=C:\\Program Files\\ArcGIS\\Pro\\bin\\Python\\envs\\arcgispro-py3
+  Reads with the GDAL OpenFileGDB driver (via pyogrio), so ArcGIS isn't required. Features are streamed in batches
+  of --batch_size, so memory use is bounded by the batch rather than the layer.
+  --columns limits the exported attributes and --where is an attribute filter (OGR SQL), e.g. --where "county_id = 85"
+  With --all, each layer gets the --columns it has, and --where only if it has every column the filter references;
+  a layer that fails is reported (and the exit status is 1) without stopping the others.
 
 """
 
-import argparse, os, sys, time
-import arcpy
+import argparse, concurrent.futures, fnmatch, json, os, re, sys, time
+import pyarrow, pyarrow.csv, pyarrow.parquet
+import pyogrio
+import shapely
 
-if __name__ == '__main__':
+BATCH_SIZE = 65536
 
-    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter,)
-    parser.add_argument("geodatabase",  metavar="geodatabase.gdb", help="File geodatabase with layer export")
-    parser.add_argument("--layer", help="Layer to export")
-    parser.add_argument("--format", choices=["csv","dbf","shp","geojson"])
+FORMAT_EXTENSIONS = {'csv':'csv', 'geojson':'geojsonl', 'parquet':'parquet', 'geoparquet':'parquet'}
+GEOMETRY_FORMATS  = ['geojson','geoparquet']
+# format used for tables (layers without geometry) in --all mode
+TABLE_FORMATS     = {'csv':'csv', 'geojson':'csv', 'parquet':'parquet', 'geoparquet':'parquet'}
 
-    args = parser.parse_args()
+# column name for geometry when the layer doesn't name it
+DEFAULT_GEOMETRY_NAME = 'wkb_geometry'
 
-    arcpy.env.workspace = args.geodatabase
+# OGR SQL words that aren't column names, for where_columns()
+OGR_SQL_KEYWORDS = ['and','or','not','in','like','ilike','is','null','between','escape','true','false']
 
-    if not args.layer:
-        print("workspace: {}".format(arcpy.env.workspace))
-        for dataset in arcpy.ListDatasets():
-            print("  dataset: {}".format(dataset))
-            print("    feature classes: {} ".format(arcpy.ListFeatureClasses(feature_dataset=dataset)))
-    
-        print("  feature classes: {} ".format(arcpy.ListFeatureClasses()))
-        print("  tables: {} ".format(arcpy.ListTables()))
 
-    if args.layer in arcpy.ListFeatureClasses():
+def list_layers(geodatabase):
+    """
+    Returns list of (layer name, geometry type) for the geodatabase; geometry type is None for tables.
+    Feature classes in feature datasets are listed by their own name.
+    """
+    return [(name, geometry_type) for name, geometry_type in pyogrio.list_layers(geodatabase)]
+
+
+def layer_inventory(geodatabase):
+    """
+    Returns list of dicts with name, type ('feature class' or 'table'), geometry_type, crs, rows and fields
+    (list of name, dtype) for each layer in the geodatabase.
+    """
+    inventory = []
+    for name, geometry_type in list_layers(geodatabase):
+        info = pyogrio.read_info(geodatabase, layer=name)
+        inventory.append({'name'         : name,
+                          'type'         : 'feature class' if geometry_type else 'table',
+                          'geometry_type': geometry_type,
+                          'crs'          : info['crs'],
+                          'rows'         : int(info['features']),
+                          'fields'       : [[field, str(dtype)] for field, dtype in zip(info['fields'], info['dtypes'])]})
+    return inventory
+
+
+def write_inventory(geodatabase, inventory, output_dir='.'):
+    """
+    Write the layer inventory to output_dir/[geodatabase name]_inventory.json and return the file name.
+    """
+    gdb_name = os.path.splitext(os.path.basename(os.path.normpath(geodatabase)))[0]
+    output_file = os.path.join(output_dir, '{}_inventory.json'.format(gdb_name))
+    with open(output_file, 'w') as f:
+        json.dump({'geodatabase': geodatabase, 'layers': inventory}, f, indent=2)
+    return output_file
+
+
+def geoparquet_metadata(geometry_name, crs):
+    """
+    Returns the GeoParquet 'geo' file metadata for a WKB geometry column.
+    """
+    column = {'encoding': 'WKB', 'geometry_types': []}
+    if crs:
+        import pyproj
+        column['crs'] = pyproj.CRS.from_user_input(crs).to_json_dict()
+    return {'version': '1.0.0', 'primary_column': geometry_name, 'columns': {geometry_name: column}}
+
+
+class BatchWriter(object):
+    """
+    Writes record batches (with the geometry, if any, as a WKB column named geometry_name) to one output format.
+    The output is opened with the reader's schema, so a layer with no rows still gives a valid (empty) file.
+    drop_columns are read (e.g. for a where filter) but not written.
+    """
+    def __init__(self, output_file, fmt, geometry_name, crs, schema, drop_columns=()):
+        self.output_file   = output_file
+        self.fmt           = fmt
+        self.geometry_name = geometry_name
+        self.drop_columns  = list(drop_columns)
+        if fmt in ['csv','parquet']:
+            self.drop_columns.append(geometry_name)
+        self.drop_columns  = [col for col in self.drop_columns if col in schema.names]
+
+        schema = self.drop_schema(schema)
+        if fmt == 'csv':
+            self.writer = pyarrow.csv.CSVWriter(output_file, schema)
+        elif fmt == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(output_file, schema, compression='zstd')
+        elif fmt == 'geoparquet':
+            metadata = {b'geo': json.dumps(geoparquet_metadata(geometry_name, crs)).encode('utf-8')}
+            self.writer = pyarrow.parquet.ParquetWriter(output_file, schema.with_metadata(metadata), compression='zstd')
+        elif fmt == 'geojson':
+            self.writer = open(output_file, 'w')
+
+    def drop_schema(self, schema):
+        for col in self.drop_columns:
+            schema = schema.remove(schema.get_field_index(col))
+        return schema
+
+    def drop(self, batch, columns):
+        columns = [col for col in columns if col in batch.schema.names]
+        return batch.drop_columns(columns) if columns else batch
+
+    def write(self, batch):
+        batch = self.drop(batch, self.drop_columns)
+        if self.fmt in ['csv','parquet','geoparquet']:
+            self.writer.write_batch(batch)
+
+        elif self.fmt == 'geojson':
+            geometry   = shapely.to_geojson(shapely.from_wkb(batch.column(self.geometry_name).to_numpy(zero_copy_only=False)))
+            properties = self.drop(batch, [self.geometry_name]).to_pylist()
+            self.writer.writelines('{{"type":"Feature","properties":{},"geometry":{}}}\n'.format(
+                                   json.dumps(props, default=str), geom if geom is not None else 'null')
+                                   for props, geom in zip(properties, geometry))
 
-        result = arcpy.GetCount_management(os.path.join(args.geodatabase, args.layer))
-        print("Feature Class [{}] has {} rows".format(os.path.join(args.geodatabase, args.layer), result[0]))
+    def close(self):
+        self.writer.close()
 
-        if args.format == "geojson":
-            outfile = "{}.geojson".format(args.layer)
-            arcpy.FeaturesToJSON_conversion(os.path.join(args.geodatabase, args.layer), outfile, geoJSON='GEOJSON')
-            print("Wrote {}".format(outfile))
 
-        if args.format == "shp":
-            outfile = "{}.shp".format(args.layer)
-            arcpy.FeatureClassToShapefile_conversion(os.path.join(args.geodatabase, args.layer), Output_Folder=".")
-            print("Wrote {}".format(outfile))
+def where_columns(where):
+    """
+    Returns the set of (lowercase) column names referenced by an OGR SQL attribute filter.
+    """
+    where = re.sub(r"'(?:[^']|'')*'", "''", where)  # drop string literals
+    names = re.findall(r'"([^"]+)"|\b([A-Za-z_][A-Za-z0-9_]*)\b', where)
+    return set((quoted or name).lower() for quoted, name in names if quoted or name.lower() not in OGR_SQL_KEYWORDS)
 
-        if args.format == "csv":
-            outfile = os.path.join(".","{}.csv".format(args.layer))
-            arcpy.CopyRows_management(os.path.join(args.geodatabase, args.layer), outfile)
-            print("Wrote {}".format(outfile))
 
-    if args.layer in arcpy.ListTables():
+def export_layer(geodatabase, layer, fmt, output_dir='.', columns=None, where=None, batch_size=BATCH_SIZE, fields=None):
+    """
+    Stream the layer to output_dir/[layer].[ext] in fmt (see FORMAT_EXTENSIONS).
+    columns limits the attributes (None for all); where is an OGR SQL attribute filter.
+    Columns the filter uses are read even if they're not in columns (GDAL treats ignored fields as null in the
+    filter), but only columns are written. fields is the layer's field names, if known (e.g. from the inventory).
+    Returns dict with layer, format, output_file, rows, seconds.
+    """
+    start = time.time()
+    output_file = os.path.join(output_dir, '{}.{}'.format(layer, FORMAT_EXTENSIONS[fmt]))
+    read_geometry = fmt in GEOMETRY_FORMATS
 
-        result = arcpy.GetCount_management(os.path.join(args.geodatabase, args.layer))
-        print("Table [{}] has {} rows".format(os.path.join(args.geodatabase, args.layer), result[0]))
+    filter_columns = []
+    if columns is not None and where:
+        if fields is None:
+            fields = pyogrio.read_info(geodatabase, layer=layer)['fields']
+        fields = dict((field.lower(), field) for field in fields)
+        filter_columns = [fields[col] for col in sorted(where_columns(where)) if col in fields and fields[col] not in columns]
+
+    rows = 0
+    with pyogrio.open_arrow(geodatabase, layer=layer, columns=None if columns is None else list(columns) + filter_columns,
+                            where=where, read_geometry=read_geometry,
+                            batch_size=batch_size, use_pyarrow=True) as (meta, reader):
+        geometry_name = meta['geometry_name'] or DEFAULT_GEOMETRY_NAME
+        if read_geometry and geometry_name not in reader.schema.names:
+            raise ValueError("Layer {} has no geometry; use csv or parquet".format(layer))
+
+        writer = BatchWriter(output_file, fmt, geometry_name, meta['crs'], reader.schema, drop_columns=filter_columns)
+        try:
+            for batch in reader:
+                writer.write(batch)
+                rows += batch.num_rows
+        finally:
+            writer.close()
+
+    return {'layer': layer, 'format': fmt, 'output_file': output_file, 'rows': rows, 'seconds': time.time() - start}
+
+
+def export_layers(geodatabase, inventory, fmt, output_dir='.', columns=None, where=None, batch_size=BATCH_SIZE, workers=None):
+    """
+    Export the layers in inventory (from layer_inventory()) concurrently in a process pool, printing each layer as it
+    finishes. Tables get TABLE_FORMATS[fmt].
+    columns is limited to those each layer has; where is applied only to layers that have all the columns it references
+    (the others are exported unfiltered), and those columns are read for the filter even if they're not in columns. A layer that fails is reported and the rest are still exported.
+    Returns list of export_layer() results, in inventory order; failed layers have 'error' and no 'output_file'.
+    """
+    start = time.time()
+    results = {}
+    referenced = where_columns(where) if where else set()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {}
+        for layer in inventory:
+            fields = [field for field, dtype in layer['fields']]
+            layer_columns = [col for col in columns if col in fields] if columns else None
+            layer_where   = where if referenced.issubset(field.lower() for field in fields) else None
+            if where and not layer_where:
+                print("  {:40} doesn't have {}; exporting without --where".format(layer['name'], sorted(referenced)))
+            futures[executor.submit(export_layer, geodatabase, layer['name'],
+                                    fmt if layer['geometry_type'] else TABLE_FORMATS[fmt],
+                                    output_dir, layer_columns, layer_where, batch_size, fields)] = layer['name']
+
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'layer': futures[future], 'format': fmt, 'rows': 0, 'seconds': 0.0, 'error': str(e)}
+                results[futures[future]] = result
+                print("  [{}/{}] {:40} FAILED: {}".format(len(results), len(futures), result['layer'], e))
+                continue
+            results[futures[future]] = result
+            print("  [{}/{}] {:40} {:>12,} rows {:8.1f} s {:>12,.0f} rows/s".format(
+                  len(results), len(futures), result['layer'], result['rows'], result['seconds'],
+                  result['rows'] / max(result['seconds'], 1e-6)))
+
+    seconds = time.time() - start
+    rows   = sum(result['rows'] for result in results.values())
+    failed = [result['layer'] for result in results.values() if 'error' in result]
+    print("Exported {:,} layers, {:,} rows in {:.1f} seconds ({:,.0f} rows/s)".format(len(results) - len(failed), rows, seconds, rows / max(seconds, 1e-6)))
+    if failed:
+        print("Failed to export {:,} layers: {}".format(len(failed), failed))
+    return [results[layer['name']] for layer in inventory]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter,)
+    parser.add_argument("geodatabase",  metavar="geodatabase.gdb", help="File geodatabase with layer export")
+    parser.add_argument("--layer", help="Layer to export")
+    parser.add_argument("--format", choices=list(FORMAT_EXTENSIONS.keys()), default="csv")
+    parser.add_argument("--columns", nargs="+", help="Attributes to export (default: all)")
+    parser.add_argument("--where", help="Attribute filter, e.g. \"county_id = 85\"")
+    parser.add_argument("--output_dir", default=".", help="Output directory")
+    parser.add_argument("--batch_size", type=int, default=BATCH_SIZE, help="Features per batch")
+    parser.add_argument("--inventory", action="store_true", help="Write the layer inventory json")
+    parser.add_argument("--all", action="store_true", help="Export all layers (or those matching --layer_pattern)")
+    parser.add_argument("--layer_pattern", default="*", help="With --all, layer name pattern to export")
+    parser.add_argument("--workers", type=int, help="With --all, number of layers to export concurrently")
+
+    args = parser.parse_args()
+
+    if args.inventory or args.all:
+        inventory = layer_inventory(args.geodatabase)
+        if args.inventory:
+            print("Wrote {}".format(write_inventory(args.geodatabase, inventory, args.output_dir)))
+        if args.all:
+            selected = [layer for layer in inventory if fnmatch.fnmatch(layer['name'], args.layer_pattern)]
+            print("Exporting {:,} of {:,} layers from {}".format(len(selected), len(inventory), args.geodatabase))
+            results = export_layers(args.geodatabase, selected, args.format, output_dir=args.output_dir,
+                                    columns=args.columns, where=args.where, batch_size=args.batch_size, workers=args.workers)
+            if any('error' in result for result in results):
+                sys.exit(1)
+        sys.exit(0)
+
+    layers = list_layers(args.geodatabase)
+    if not args.layer:
+        print("workspace: {}".format(args.geodatabase))
+        print("  feature classes: {} ".format([name for name, geometry_type in layers if geometry_type]))
+        print("  tables: {} ".format([name for name, geometry_type in layers if not geometry_type]))
+        sys.exit(0)
 
-        if args.format == "csv":
-            outfile = "{}.csv".format(args.layer)
-            arcpy.TableToTable_conversion(os.path.join(args.geodatabase, args.layer), out_path=".", out_name=outfile)
-            print("Write {}".format(outfile))
+    if args.layer not in [name for name, geometry_type in layers]:
+        print("Layer [{}] not found in {}".format(args.layer, args.geodatabase))
+        sys.exit(2)
 
-        if args.format == "dbf":
-            outfile = "{}.dbf".format(args.layer)
-            arcpy.TableToTable_conversion(os.path.join(args.geodatabase, args.layer), out_path=".", out_name=outfile)
-            print("Wrote {}".format(outfile))
+    info = pyogrio.read_info(args.geodatabase, layer=args.layer)
+    print("{} [{}] has {} rows".format("Feature Class" if info['geometry_type'] else "Table",
+                                       os.path.join(args.geodatabase, args.layer), info['features']))
 
+    result = export_layer(args.geodatabase, args.layer, args.format, output_dir=args.output_dir,
+                          columns=args.columns, where=args.where, batch_size=args.batch_size)
+    print("Wrote {:,} rows to {} in {:.1f} seconds".format(result['rows'], result['output_file'], result['seconds']))
@@ -2,28 +2,17 @@
 # coding: utf-8
 
 # This code take the building.csv file (output of development project script) and put it in the H5 file holder
+# The table is written compressed, chunk by chunk, and swapped in once complete, on a copy of the store that then
+# replaces it (see h5_store.py)
 
-import numpy as  np
-import pandas as pd
+from h5_store import replace_table
 
-#read the latest building file
-building = pd.read_csv('C:/Users/blu/Box/Modeling and Surveys/Urban Modeling/Bay Area UrbanSim 1.5/H5 Contents/h5 contents/buildings_2020Mar20.1512.csv')
+#latest building file
+BUILDING_FILE = 'C:/Users/blu/Box/Modeling and Surveys/Urban Modeling/Bay Area UrbanSim 1.5/H5 Contents/h5 contents/buildings_2020Mar20.1512.csv'
 
-#read store
-store = pd.HDFStore('C:/Users/blu/Box/Modeling and Surveys/Urban Modeling/Bay Area UrbanSim 1.5/PBA50/Current PBA50 Large General Input Data/2020_03_17_bayarea_v5.h5')
-
-#open the store
-store.open()
-
-#check if H5 has alread the building file
-
-keys = store.keys()
-if '/buildings' in keys:
-	store.remove('buildings')
-	store.put('buildings',building,format = 'table', append = False)
-else:
-	store.put('buildings',building,format = 'table', append = False)
-
-#close the store
-store.close()
+#store
+STORE_FILE = 'C:/Users/blu/Box/Modeling and Surveys/Urban Modeling/Bay Area UrbanSim 1.5/PBA50/Current PBA50 Large General Input Data/2020_03_17_bayarea_v5.h5'
 
+#replace the buildings in the store, if there are any
+entry = replace_table(STORE_FILE, 'buildings', BUILDING_FILE, copy=True)
+print("Wrote {:,} buildings from {} to {}".format(entry['rows'], entry['source']['file'], STORE_FILE))
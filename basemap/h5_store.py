@@ -0,0 +1,488 @@
+USAGE = """
+  Replace a table (e.g. parcels, buildings, households, jobs) in an UrbanSim h5 store (e.g. 2020_03_17_bayarea_v5.h5)
+  from a csv or parquet file, without leaving the store without the table if anything fails.
+
+  The table is written chunk by chunk, compressed, as key _tmp_[key] and is swapped in for [key] only once it's
+  complete. With --copy the update is made on a copy of the store which then replaces the store file, so the
+  store file itself is never modified in place.
+
+  The table is indexed by --index_col, by default the key's id column (KEY_INDEX_COLUMNS, e.g. parcel_id for parcels)
+  as UrbanSim expects; other keys get a row number index unless --index_col is given.
+
+  Columns in INDEX_COLUMNS (parcel_id, zone_id, county_id, building_type, year_built) are written as indexed data
+  columns, so reads can be filtered in PyTables rather than after loading the table, e.g. to extract one county:
+    python h5_store.py bayarea_v5.h5 parcels --where "county_id == 85" --output_file parcels_85.csv
+
+  The store keeps a manifest (a json attribute of the root node) with each table's rows, dtypes, content hash and
+  source file, updated with the table. --manifest prints it; --fingerprint [keys] adds tables written otherwise.
+  Each table written by h5_store also carries its hash as a node attribute (SIGNATURE_ATTR), which another writer
+  replacing the table (e.g. store.put) doesn't keep; readers should use current_manifest_entry(), which drops entries
+  whose table has lost that signature or whose row count no longer matches.
+
+"""
+
+# The source is read twice: a first pass over the chunks determines each column's dtype (e.g. a column that's int in
+# one csv chunk and float in another because of missing values is float, and one that's text in any chunk is text)
+# and the width of each text column, so every chunk is appended with the same schema and min_itemsize.
+# Data column indexes are built once at the end.
+
+import argparse, datetime, hashlib, json, os, shutil, sys, tempfile, time
+import numpy as np
+import pandas as pd
+
+# tables the UrbanSim basemap store holds
+STORE_KEYS = ['parcels','buildings','households','jobs']
+
+# index of each store table (UrbanSim tables are indexed by their id)
+KEY_INDEX_COLUMNS = {'parcels'   : 'parcel_id',
+                     'buildings' : 'building_id',
+                     'households': 'household_id',
+                     'jobs'      : 'job_id'}
+
+# columns written as indexed data columns (where present), for where= queries
+INDEX_COLUMNS = ['parcel_id','zone_id','county_id','building_type','year_built']
+
+CHUNKSIZE  = 500000
+COMPLIB    = 'blosc:zstd'
+COMPLEVEL  = 5
+
+TEMP_KEY_PREFIX = '_tmp_'
+
+# how nulls in text columns are stored (pandas' default)
+NAN_REP         = 'nan'
+
+# root node attribute with the store manifest json
+MANIFEST_ATTR   = 'manifest'
+# table node attribute with the hash of the manifest entry it was written with
+SIGNATURE_ATTR  = 'h5_store_hash'
+
+
+def read_chunks(source_file, chunksize=CHUNKSIZE, columns=None):
+    """
+    Yields dataframes of up to chunksize rows from a csv or parquet file.
+    """
+    if os.path.splitext(source_file)[1].lower() == '.parquet':
+        import pyarrow.parquet
+        for batch in pyarrow.parquet.ParquetFile(source_file).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(source_file, chunksize=chunksize, usecols=columns):
+            yield chunk
+
+
+def text_length(values):
+    """
+    Returns the longest non-null value of values as text, in encoded (UTF-8) bytes as PyTables stores it.
+    """
+    values = values.dropna()
+    if len(values) == 0:
+        return 0
+    return int(values.astype(str).str.encode('utf-8').str.len().max())
+
+
+def scan_schema(source_file, chunksize=CHUNKSIZE):
+    """
+    Returns (dtypes, max_string_lengths) over all chunks of source_file: dtypes is a dict of column to the dtype that
+    holds every chunk's values (object for a column that's text in any chunk), max_string_lengths is a dict of
+    text column to the width it needs, in bytes, including the width of NAN_REP if the column has nulls.
+    """
+    dtypes, lengths, nulls, numeric, columns = {}, {}, {}, set(), None
+    for chunk in read_chunks(source_file, chunksize):
+        if columns is None:
+            columns = list(chunk.columns)
+        for col in columns:
+            dtype = chunk[col].dtype
+            if dtype == object or dtypes.get(col) == object:
+                dtypes[col] = np.dtype(object)
+            else:
+                dtypes[col] = np.result_type(dtypes[col], dtype) if col in dtypes else dtype
+            if dtype == object:
+                lengths[col] = max(lengths.get(col, 0), text_length(chunk[col]))
+            else:
+                numeric.add(col)
+            nulls[col] = nulls.get(col, False) or bool(chunk[col].isnull().any())
+
+    text_columns = [col for col in columns or [] if dtypes[col] == object]
+    # text columns that are numeric in some chunks are written as the text of those numbers too, so measure them
+    mixed = [col for col in text_columns if col in numeric]
+    if mixed:
+        for chunk in read_chunks(source_file, chunksize, columns=mixed):
+            for col in mixed:
+                lengths[col] = max(lengths.get(col, 0), text_length(chunk[col]))
+    for col in text_columns:
+        if nulls[col]:
+            lengths[col] = max(lengths.get(col, 0), len(NAN_REP))
+    return dict((col, dtypes[col]) for col in columns or []), dict((col, lengths.get(col, 0)) for col in text_columns)
+
+
+def cast_chunk(chunk, dtypes):
+    """
+    Cast chunk to dtypes (from scan_schema()); values of text columns are cast to str, keeping nulls.
+    """
+    for col, dtype in dtypes.items():
+        if dtype == object:
+            chunk[col] = chunk[col].astype(str).where(chunk[col].notnull())
+        elif chunk[col].dtype != dtype:
+            chunk[col] = chunk[col].astype(dtype)
+    return chunk
+
+
+def write_table(store, key, source_file, data_columns=INDEX_COLUMNS, min_itemsize=None, chunksize=CHUNKSIZE,
+                complib=COMPLIB, complevel=COMPLEVEL, index_col=None):
+    """
+    Write source_file (csv or parquet) to key in the open HDFStore, appending chunk by chunk in table format.
+    index_col is the column to index the table by (None for a row number index); it's queryable like a data column.
+    min_itemsize defaults to each text column's longest value and can be overridden per column.
+    Returns the table's manifest entry (see table_fingerprint()).
+    """
+    dtypes, lengths = scan_schema(source_file, chunksize)
+    if index_col and index_col not in dtypes:
+        raise ValueError("{} has no index column {}".format(source_file, index_col))
+    lengths.update(min_itemsize or {})
+    if index_col in lengths:
+        # pandas sizes a text index by min_itemsize['index']
+        lengths['index'] = lengths.pop(index_col)
+    data_columns = [col for col in (data_columns or []) if col in dtypes and col != index_col]
+
+    if key in store:
+        store.remove(key)
+    rows, content_hash = 0, hashlib.sha256()
+    for chunk in read_chunks(source_file, chunksize):
+        chunk = cast_chunk(chunk, dtypes)
+        if index_col:
+            chunk = chunk.set_index(index_col)
+        else:
+            chunk.index = pd.RangeIndex(rows, rows+len(chunk))
+        store.append(key, chunk, format='table', data_columns=data_columns, min_itemsize=lengths or None,
+                     nan_rep=NAN_REP, complib=complib, complevel=complevel, index=False)
+        update_hash(content_hash, chunk)
+        rows += len(chunk)
+
+    store.create_table_index(key, columns=['index'] + data_columns, optlevel=9, kind='full')
+    columns = dict((col, dtype) for col, dtype in dtypes.items() if col != index_col)
+    return manifest_entry(rows, columns, content_hash, source_file, index_col=index_col)
+
+
+def update_hash(content_hash, chunk):
+    """
+    Add a chunk's index and values to content_hash; the hash depends on row order and chunk boundaries don't matter.
+    The schema is added to the hash by manifest_entry().
+    """
+    content_hash.update(pd.util.hash_pandas_object(chunk, index=True).to_numpy().tobytes())
+
+
+def manifest_entry(rows, dtypes, content_hash, source_file=None, index_col=None):
+    """
+    Returns the manifest entry for a table. Its hash covers the column names, order and dtypes and the index column
+    as well as content_hash (the index and values), so a renamed, retyped or re-indexed column changes it.
+    """
+    schema = [[col, str(dtype)] for col, dtype in dtypes.items()]
+    table_hash = hashlib.sha256(json.dumps([schema, index_col]).encode('utf-8'))
+    table_hash.update(content_hash.digest())
+    entry = {'rows'   : int(rows),
+             'index'  : index_col,
+             'columns': [col for col, dtype in schema],
+             'dtypes' : dict(schema),
+             'hash'   : table_hash.hexdigest(),
+             'source' : None,
+             'written': datetime.datetime.now().isoformat(timespec='seconds')}
+    if source_file:
+        entry['source'] = {'file' : os.path.basename(source_file),
+                           'path' : os.path.abspath(source_file),
+                           'size' : os.path.getsize(source_file),
+                           'mtime': datetime.datetime.fromtimestamp(os.path.getmtime(source_file)).isoformat(timespec='seconds')}
+    return entry
+
+
+def table_fingerprint(store, key, chunksize=CHUNKSIZE):
+    """
+    Returns the manifest entry (rows, index, dtypes, hash) for a table already in the open HDFStore; its source is unknown.
+    Table format tables are read in chunks, fixed format tables whole.
+    """
+    storer = store.get_storer(key)
+    chunks = store.select(key, chunksize=chunksize) if storer.is_table else [store.select(key)]
+    rows, dtypes, index_col, content_hash = 0, None, None, hashlib.sha256()
+    for chunk in chunks:
+        dtypes = dtypes or chunk.dtypes.to_dict()
+        index_col = chunk.index.name
+        update_hash(content_hash, chunk)
+        rows += len(chunk)
+    return manifest_entry(rows, dtypes or {}, content_hash, index_col=index_col)
+
+
+def get_manifest(store):
+    """
+    Returns the manifest of the open HDFStore: dict of table key to its entry.
+    """
+    attrs = store._handle.root._v_attrs
+    return json.loads(attrs[MANIFEST_ATTR]) if MANIFEST_ATTR in attrs._v_attrnames else {}
+
+
+def set_manifest(store, manifest, pending=()):
+    """
+    Write the manifest, dropping entries for tables no longer in the store other than pending keys (about to be written).
+    """
+    keys = set(key.strip('/') for key in store.keys()) | set(pending)
+    manifest = dict((key, entry) for key, entry in manifest.items() if key in keys)
+    store._handle.root._v_attrs[MANIFEST_ATTR] = json.dumps(manifest, sort_keys=True)
+
+
+def table_rows(store, key):
+    """
+    Returns the number of rows of key in the open HDFStore, from its metadata (without reading the table).
+    """
+    storer = store.get_storer(key)
+    if storer.is_table:
+        return int(storer.nrows)
+    # fixed format frames store the row index as axis1
+    return int(store._handle.get_node('/'+key.strip('/')).axis1.shape[0])
+
+
+def set_signature(store, key, entry):
+    """
+    Mark the table key in the open HDFStore as the one entry describes.
+    """
+    store.get_storer(key).attrs[SIGNATURE_ATTR] = entry['hash']
+
+
+def table_signature(store, key):
+    """
+    Returns the hash key was marked with by set_signature(), or None; replacing the table's node (e.g. store.put)
+    drops it.
+    """
+    attrs = store.get_storer(key).attrs
+    return attrs[SIGNATURE_ATTR] if SIGNATURE_ATTR in attrs._v_attrnames else None
+
+
+def current_manifest_entry(store_file, key):
+    """
+    Returns the manifest entry for key if it still describes the table, else None: the entry is dropped if key
+    isn't in the store, the table doesn't carry the entry's hash as its signature (it was rewritten by another
+    writer) or its row count differs (it was appended to).
+    """
+    with pd.HDFStore(store_file, mode='r') as store:
+        entry = get_manifest(store).get(key.strip('/'))
+        if entry is None or key.strip('/') not in [k.strip('/') for k in store.keys()]:
+            return None
+        if table_signature(store, key) != entry['hash'] or table_rows(store, key) != entry['rows']:
+            return None
+        return entry
+
+
+def read_manifest(store_file):
+    """
+    Returns the manifest of store_file, e.g. read_manifest(store_file)['buildings']['hash'] to key a cache on the
+    buildings table or ['source']['file'] for the csv it was written from.
+    """
+    with pd.HDFStore(store_file, mode='r') as store:
+        return get_manifest(store)
+
+
+def fingerprint_tables(store_file, keys=None, chunksize=CHUNKSIZE):
+    """
+    Add manifest entries for keys (default: tables without one) of store_file. Returns the manifest.
+    """
+    with pd.HDFStore(store_file, mode='a') as store:
+        manifest = get_manifest(store)
+        keys = keys or [key.strip('/') for key in store.keys() if key.strip('/') not in manifest]
+        for key in keys:
+            manifest[key] = table_fingerprint(store, key, chunksize)
+            set_signature(store, key, manifest[key])
+        set_manifest(store, manifest)
+        return get_manifest(store)
+
+
+def replace_table(store_file, key, source_file, data_columns=INDEX_COLUMNS, min_itemsize=None, chunksize=CHUNKSIZE,
+                  complib=COMPLIB, complevel=COMPLEVEL, copy=False, index_col=None):
+    """
+    Replace key in the store_file h5 with source_file (csv or parquet); see write_table().
+    index_col defaults to KEY_INDEX_COLUMNS[key] (a row number index for other keys); pass False for a row number index.
+    The table is written to TEMP_KEY_PREFIX+key and renamed to key once complete, with its manifest entry.
+    With copy, this is done on a copy of store_file, which then replaces store_file.
+    Returns the table's manifest entry.
+    """
+    key = key.strip('/')
+    if index_col is None:
+        index_col = KEY_INDEX_COLUMNS.get(key)
+    target_file = store_file
+    if copy:
+        target_file = '{}.{}.tmp'.format(store_file, os.getpid())
+        if os.path.exists(store_file):
+            shutil.copyfile(store_file, target_file)
+
+    try:
+        with pd.HDFStore(target_file, mode='a') as store:
+            old_manifest = get_manifest(store)
+            try:
+                entry = write_table(store, TEMP_KEY_PREFIX+key, source_file, data_columns=data_columns, min_itemsize=min_itemsize,
+                                    chunksize=chunksize, complib=complib, complevel=complevel, index_col=index_col)
+                # the entry is written before the swap, so a crash can't leave the new table under the old table's hash
+                # (a crash before the swap leaves the new entry with the old table, which current_manifest_entry()
+                # drops if the row counts differ; use copy to rule both out)
+                set_signature(store, TEMP_KEY_PREFIX+key, entry)
+                manifest = dict(old_manifest)
+                manifest[key] = entry
+                set_manifest(store, manifest, pending=[key])
+                store._handle.flush()
+                store._handle.rename_node('/'+TEMP_KEY_PREFIX+key, key, overwrite=True)
+                store._handle.flush()
+            except BaseException:
+                # don't leave the partial table or its entry in the store
+                if TEMP_KEY_PREFIX+key in store:
+                    store.remove(TEMP_KEY_PREFIX+key)
+                set_manifest(store, old_manifest)
+                raise
+    except BaseException:
+        if copy and os.path.exists(target_file):
+            os.remove(target_file)
+        raise
+
+    if copy:
+        os.replace(target_file, store_file)
+    return entry
+
+
+def where_terms(where=None, **filters):
+    """
+    Returns the where expression combining where with column filters, e.g. county_id=85 or zone_id=[1,2,3]
+    (a list matches any of its values).
+    """
+    terms = [where] if where else []
+    for col, value in filters.items():
+        # tolist()/item() give python values, whose repr pandas can parse
+        if isinstance(value, (list, tuple, set, np.ndarray, pd.Index, pd.Series)):
+            value = pd.Index(list(value)).tolist()
+        elif isinstance(value, np.generic):
+            value = value.item()
+        terms.append("{} == {!r}".format(col, value))
+    return " & ".join("({})".format(term) for term in terms) or None
+
+
+def query_table(store_file, key, where=None, columns=None, **filters):
+    """
+    Read the rows of key matching where and filters (see where_terms()), e.g.
+      query_table(store_file, 'parcels', county_id=85)
+      query_table(store_file, 'buildings', where="year_built > 2015", zone_id=[101, 102], columns=['parcel_id','residential_units'])
+    The predicates are evaluated in PyTables, using the indexes of the data columns, so only matching rows are read.
+    Only the index and data columns can be filtered on; the table must be in table format.
+    """
+    with pd.HDFStore(store_file, mode='r') as store:
+        storer = store.get_storer(key)
+        if not storer.is_table:
+            raise ValueError("{} in {} is in fixed format and can't be queried; rewrite it with h5_store.py".format(key, store_file))
+        queryables = [name for name in storer.queryables() if name != 'columns']
+        unknown = set(filters) - set(queryables)
+        if unknown:
+            raise ValueError("{} aren't the index or data columns of {}; those are {}".format(sorted(unknown), key, queryables))
+        return store.select(key, where=where_terms(where, **filters), columns=columns)
+
+
+def self_check(chunksize=4):
+    """
+    Write a csv whose chunks differ in schema to a temporary store and compare the table read back with the csv:
+    a column that's numeric in the first chunk and text in the second, a one character Y/N column with nulls only
+    in the second chunk, and a non-ASCII text column. The table is indexed by building_id, and its manifest entry
+    stops being current once the table is rewritten without h5_store.
+    """
+    temp_dir = tempfile.mkdtemp(prefix='h5_store_')
+    try:
+        source_file = os.path.join(temp_dir, 'source.csv')
+        source = pd.DataFrame({'building_id': range(101, 109),
+                               'parcel_id': range(1, 9),
+                               'mixed'    : ['1','2','3','4','A1','B2','5','C3'],
+                               'flag'     : ['Y','N','Y','N',None,'Y',None,'N'],
+                               'name'     : ['San José','Vallejo','Peñasco','Napa','Ukiah','Cañada','Daly City','Alameda']})
+        source.to_csv(source_file, index=False)
+
+        store_file = os.path.join(temp_dir, 'store.h5')
+        entry = replace_table(store_file, 'buildings', source_file, chunksize=chunksize, copy=True)
+        table = pd.read_hdf(store_file, 'buildings')
+
+        assert entry['rows'] == len(source) == len(table)
+        assert table.index.name == 'building_id' and table.index.tolist() == source['building_id'].tolist()
+        assert 'building_id' not in table.columns
+        assert table['mixed'].tolist() == source['mixed'].tolist()
+        assert table['flag'].isnull().tolist() == source['flag'].isnull().tolist()
+        assert table['flag'].dropna().tolist() == source['flag'].dropna().tolist()
+        assert table['name'].tolist()  == source['name'].tolist()
+        with pd.HDFStore(store_file, mode='r') as store:
+            assert TEMP_KEY_PREFIX+'buildings' not in store
+        assert current_manifest_entry(store_file, 'buildings') == entry
+        # another writer replacing the table with as many rows makes the entry stale
+        with pd.HDFStore(store_file, mode='a') as store:
+            store.put('buildings', table, format='table')
+        assert current_manifest_entry(store_file, 'buildings') is None
+    finally:
+        shutil.rmtree(temp_dir)
+    print("Self check passed")
+
+
+def parse_min_itemsize(values):
+    """
+    Parses ["col=length", ...] into a dict.
+    """
+    min_itemsize = {}
+    for value in values or []:
+        col, length = value.split('=')
+        min_itemsize[col] = int(length)
+    return min_itemsize
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter,)
+    parser.add_argument("store_file",     metavar="store.h5",   nargs="?", help="UrbanSim h5 store to update")
+    parser.add_argument("key",            nargs="?", help="Table to replace, e.g. {}".format(", ".join(STORE_KEYS)))
+    parser.add_argument("source_file",    nargs="?", help="Table csv or parquet")
+    parser.add_argument("--index_col",    help="Column to index the table by (default: {}; 'none' for a row number index)".format(
+                                                   ", ".join("{} for {}".format(col, key) for key, col in KEY_INDEX_COLUMNS.items())))
+    parser.add_argument("--data_columns", nargs="+", default=INDEX_COLUMNS, help="Columns to write as indexed data columns")
+    parser.add_argument("--min_itemsize", nargs="+", metavar="COLUMN=LENGTH", help="String column widths (default: longest value)")
+    parser.add_argument("--chunksize",    type=int, default=CHUNKSIZE, help="Rows per chunk")
+    parser.add_argument("--complib",      default=COMPLIB, help="Compression library, e.g. blosc:zstd, zlib")
+    parser.add_argument("--complevel",    type=int, default=COMPLEVEL, help="Compression level")
+    parser.add_argument("--copy",         action="store_true", help="Update a copy of the store and replace the store file")
+    parser.add_argument("--where",        help="Without source_file, query key with this where expression")
+    parser.add_argument("--columns",      nargs="+", help="With --where, columns to read")
+    parser.add_argument("--output_file",  help="With --where, csv to write the rows to")
+    parser.add_argument("--manifest",     action="store_true", help="Print the store manifest")
+    parser.add_argument("--fingerprint",  nargs="*", metavar="KEY", help="Add manifest entries for these tables (default: those without one)")
+    parser.add_argument("--self_check",   action="store_true", help="Write a csv with differing chunk schemas to a temporary store and check it")
+    args = parser.parse_args()
+
+    if args.self_check:
+        self_check()
+        sys.exit(0)
+
+    if not args.store_file:
+        parser.error("store_file is required")
+
+    if args.manifest or args.fingerprint is not None:
+        manifest = fingerprint_tables(args.store_file, args.fingerprint) if args.fingerprint is not None else read_manifest(args.store_file)
+        print(json.dumps(manifest, indent=2, sort_keys=True))
+        sys.exit(0)
+
+    if not args.key:
+        parser.error("key is required")
+
+    if not args.source_file:
+        if not args.where:
+            parser.error("source_file or --where is required")
+        start = time.time()
+        rows = query_table(args.store_file, args.key, where=args.where, columns=args.columns)
+        print("Read {:,} rows of {} matching {} in {:.2f} seconds".format(len(rows), args.key, args.where, time.time() - start))
+        if args.output_file:
+            rows.to_csv(args.output_file)
+            print("Wrote {}".format(args.output_file))
+        sys.exit(0)
+
+    if args.key.strip('/') not in STORE_KEYS:
+        print("Note: {} isn't one of the basemap store keys {}".format(args.key, STORE_KEYS))
+
+    start = time.time()
+    entry = replace_table(args.store_file, args.key, args.source_file, data_columns=args.data_columns,
+                          min_itemsize=parse_min_itemsize(args.min_itemsize), chunksize=args.chunksize,
+                          complib=args.complib, complevel=args.complevel, copy=args.copy,
+                          index_col=False if (args.index_col or '').lower() == 'none' else args.index_col)
+    print("Wrote {:,} rows from {} to {}/{} in {:.1f} seconds; hash {}".format(entry['rows'], args.source_file, args.store_file,
+                                                                                args.key.strip('/'), time.time() - start, entry['hash']))
@@ -2,26 +2,96 @@ USAGE = """
 
 Reads a feature class from an input geodatabase, joins with csv, and exports to new feature class in output geodatabase.
 
-"""
-
-import argparse, os, sys, time
-import arcpy, numpy, pandas
-
-if __name__ == '__main__':
+If output is a GeoPackage (.gpkg) or GeoParquet (.parquet) file, arcpy isn't used: only the geometry and join field are
+read from the input layer (with the GDAL OpenFileGDB driver via pyogrio), streamed in batches, joined to the csv
+by an index lookup and written once to the output as layer [csv name]_joined. Join keys in the layer without
+a csv row, and csv keys not in the layer, are reported.
 
-    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter,)
-    parser.add_argument("input_gdb",    metavar="input.gdb",   help="Input geodatabase")
-    parser.add_argument("input_layer",  metavar="input_layer", help="Geometry layer in input geodatabase")
-    parser.add_argument("join_csv",     metavar="join.csv",    help="CSV layer for joining")
-    parser.add_argument("join_field",   metavar="join_field",  help="Join field in input_layer and join_csv")    
-    parser.add_argument("output_gdb",   metavar="output.gdb",  help="Output geodatabase ")
+"""
 
-    args = parser.parse_args()
-    print(" {:15}: {}".format("input_gdb",   args.input_gdb))
-    print(" {:15}: {}".format("input_layer", args.input_layer))
-    print(" {:15}: {}".format("join_csv",    args.join_csv))
-    print(" {:15}: {}".format("join_field",  args.join_field))
-    print(" {:15}: {}".format("output_gdb",  args.output_gdb))
+import argparse, json, os, sys, time
+import numpy, pandas
+
+# output extensions written without arcpy
+ATTRIBUTE_JOIN_FORMATS = {'.gpkg':'GPKG', '.parquet':'GeoParquet'}
+
+BATCH_SIZE = 65536
+
+
+def join_table_name(join_csv):
+    """
+    Table name for the join csv: the file name without extension and leading numbers, _ and -.
+    """
+    table_name = os.path.splitext(os.path.split(join_csv)[1])[0]
+    return table_name.lstrip("0123456789_-")
+
+
+def attribute_join(input_gdb, input_layer, join_df, join_field, output_file, layer_name, batch_size=BATCH_SIZE):
+    """
+    Join join_df (with unique join_field) to the geometry of input_layer and write output_file (.gpkg or .parquet).
+    Returns dict with rows, unmatched_layer_keys (layer features without a csv row) and
+    unmatched_csv_keys (csv keys not found in the layer), both as arrays of keys.
+    """
+    import pyarrow, pyarrow.parquet, pyogrio
+    from export_filegdb_layers import geoparquet_metadata, DEFAULT_GEOMETRY_NAME
+
+    driver = ATTRIBUTE_JOIN_FORMATS[os.path.splitext(output_file)[1].lower()]
+    if join_df[join_field].duplicated().any():
+        raise ValueError("{} has duplicate {} values".format(layer_name, join_field))
+
+    join_index   = pandas.Index(join_df[join_field])
+    join_columns = [col for col in join_df.columns if col != join_field]
+    join_table   = pyarrow.Table.from_pandas(join_df[join_columns], preserve_index=False)
+    matched      = numpy.zeros(len(join_df), dtype=bool)
+    unmatched    = []
+
+    rows   = 0
+    writer = None
+    with pyogrio.open_arrow(input_gdb, layer=input_layer, columns=[join_field], batch_size=batch_size,
+                            use_pyarrow=True) as (meta, reader):
+        geometry_name = meta['geometry_name'] or DEFAULT_GEOMETRY_NAME
+        schema = pyarrow.schema([reader.schema.field(join_field)] + list(join_table.schema) +
+                                [reader.schema.field(geometry_name)])
+
+        # the output is created from the schema before reading, so a layer with no features still gives a valid file
+        if driver == 'GeoParquet':
+            metadata = {b'geo': json.dumps(geoparquet_metadata(geometry_name, meta['crs'])).encode('utf-8')}
+            writer = pyarrow.parquet.ParquetWriter(output_file, schema.with_metadata(metadata), compression='zstd')
+        else:
+            pyogrio.write_arrow(schema.empty_table(), output_file, layer=layer_name, driver=driver, geometry_name=geometry_name,
+                                geometry_type=meta['geometry_type'], crs=meta['crs'])
+
+        for batch in reader:
+            keys = batch.column(join_field).to_numpy(zero_copy_only=False)
+            join_rows = join_index.get_indexer(keys)
+            matched[join_rows[join_rows >= 0]] = True
+            unmatched.append(keys[join_rows < 0])
+
+            # null index for unmatched features gives null attributes
+            attributes = join_table.take(pyarrow.array(join_rows, mask=join_rows < 0))
+            joined = pyarrow.Table.from_arrays(
+                [batch.column(join_field)] + attributes.columns + [batch.column(geometry_name)], schema=schema)
+
+            if driver == 'GeoParquet':
+                writer.write_table(joined)
+            else:
+                pyogrio.write_arrow(joined, output_file, layer=layer_name, driver=driver, geometry_name=geometry_name,
+                                    geometry_type=meta['geometry_type'], crs=meta['crs'], append=True)
+            rows += batch.num_rows
+    if writer is not None:
+        writer.close()
+
+    return {'rows'                : rows,
+            'unmatched_layer_keys': numpy.concatenate(unmatched) if unmatched else numpy.zeros(0),
+            'unmatched_csv_keys'  : join_df[join_field].to_numpy()[~matched]}
+
+
+def arcpy_join(args, df):
+    """
+    Join in the output geodatabase with arcpy: copy the input layer, delete the non-key fields, add the csv as a table,
+    AddJoin and copy the joined features.
+    """
+    import arcpy
 
     # our workspace will be the output_gdb
     if not os.path.exists(args.output_gdb):
@@ -33,15 +103,8 @@ if __name__ == '__main__':
 
     arcpy.env.workspace = args.output_gdb
 
-    # read the csv
-    df = pandas.read_csv(args.join_csv)
-    print("Read {} lines from {}. Head:\n{}Dtypes:\n{}".format(len(df), args.join_csv, df.head(), df.dtypes))
-
     # copy to the output_gdb as a table
-    table_name = os.path.split(args.join_csv)[1]
-    table_name = os.path.splitext(table_name)[0]
-    # remove leading numbers and _
-    table_name = table_name.lstrip("0123456789_-")
+    table_name = join_table_name(args.join_csv)
     print("Adding to {} as table named {}".format(args.output_gdb, table_name))
 
     # delete table if there's already one there by that name
@@ -97,4 +160,42 @@ if __name__ == '__main__':
 
     # save it
     arcpy.CopyFeatures_management(joined_table, os.path.join(args.output_gdb, new_table_name))
-    print("Completed creation of {}".format(os.path.join(args.output_gdb, new_table_name)))
\ No newline at end of file
+    print("Completed creation of {}".format(os.path.join(args.output_gdb, new_table_name)))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter,)
+    parser.add_argument("input_gdb",    metavar="input.gdb",   help="Input geodatabase")
+    parser.add_argument("input_layer",  metavar="input_layer", help="Geometry layer in input geodatabase")
+    parser.add_argument("join_csv",     metavar="join.csv",    help="CSV layer for joining")
+    parser.add_argument("join_field",   metavar="join_field",  help="Join field in input_layer and join_csv")    
+    parser.add_argument("output_gdb",   metavar="output.gdb",  help="Output geodatabase, or .gpkg/.parquet file")
+
+    args = parser.parse_args()
+    print(" {:15}: {}".format("input_gdb",   args.input_gdb))
+    print(" {:15}: {}".format("input_layer", args.input_layer))
+    print(" {:15}: {}".format("join_csv",    args.join_csv))
+    print(" {:15}: {}".format("join_field",  args.join_field))
+    print(" {:15}: {}".format("output_gdb",  args.output_gdb))
+
+    # read the csv
+    df = pandas.read_csv(args.join_csv)
+    print("Read {} lines from {}. Head:\n{}Dtypes:\n{}".format(len(df), args.join_csv, df.head(), df.dtypes))
+
+    if os.path.splitext(args.output_gdb)[1].lower() not in ATTRIBUTE_JOIN_FORMATS:
+        arcpy_join(args, df)
+        sys.exit(0)
+
+    start = time.time()
+    layer_name = "{}_joined".format(join_table_name(args.join_csv))
+    if os.path.exists(args.output_gdb):
+        os.remove(args.output_gdb)
+        print("Found {} -- deleting".format(args.output_gdb))
+
+    result = attribute_join(args.input_gdb, args.input_layer, df, args.join_field, args.output_gdb, layer_name)
+    print("Joined {:,} features in {:.1f} seconds".format(result['rows'], time.time() - start))
+    for key_type, keys in [("layer features without a csv row", result['unmatched_layer_keys']),
+                           ("csv rows without a layer feature", result['unmatched_csv_keys'])]:
+        print("  {:,} {}{}".format(len(keys), key_type, ": {}{}".format(keys[:10].tolist(), " ..." if len(keys) > 10 else "") if len(keys) else ""))
+    print("Completed creation of {}".format(args.output_gdb))
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+USAGE = """
+  Build a parcel hazard exposure store from the SLR inundation levels (sea_level_rise/output/slr_parcel_inundation.csv)
+  and the HayWired earthquake damage by census tract (earthquake/HayWiredDestructionByCensusTract.xlsx), given a
+  parcel to census tract crosswalk.
+
+  The store is a directory of .npy arrays (see STORE_ARRAYS) plus store.json, read with load_hazard_store().
+  The Excel file is parsed once, here; scenario code memory-maps the arrays and gathers by parcel.
+
+"""
+
+# Store layout (n = parcels, t = tracts):
+#   parcel_id             (n,) int64, sorted
+#   slr_inundation        (n,) int16  - SLR (inches) from which the parcel is inundated, 0 if never
+#   tract_code            (n,) int32  - index into the tract arrays, -1 for parcels without a tract
+#   tract_geoid           (t,) int64  - census tract GEOID (11 digits; format with zfill(11))
+#   tract_existing_building_damage (t,) float32 - HayWired Exst_Bldg_Dmg share
+#   tract_fire_damage     (t,) float32 - HayWired Fire_Dmg share
+#   tract_parcel_order    (n,) int64  - parcel rows sorted by tract_code, and
+#   tract_parcel_starts   (t+1,) int64  offsets into it: the parcels of tract i are
+#                                       tract_parcel_order[tract_parcel_starts[i]:tract_parcel_starts[i+1]]
+
+import argparse, json, os
+import pandas as pd
+import numpy as np
+
+NATURAL_DIR           = os.path.dirname(os.path.abspath(__file__))
+SLR_INUNDATION_FILE   = os.path.join(NATURAL_DIR, 'sea_level_rise', 'output', 'slr_parcel_inundation.csv')
+HAYWIRED_TRACT_FILE   = os.path.join(NATURAL_DIR, 'earthquake', 'HayWiredDestructionByCensusTract.xlsx')
+
+# HayWired column -> store array
+HAYWIRED_DAMAGE_COLUMNS = {'Exst_Bldg_Dmg': 'tract_existing_building_damage',
+                           'Fire_Dmg'     : 'tract_fire_damage'}
+
+STORE_ARRAYS = ['parcel_id','slr_inundation','tract_code','tract_geoid'] + list(HAYWIRED_DAMAGE_COLUMNS.values()) + [
+                'tract_parcel_order','tract_parcel_starts']
+STORE_FILE   = 'store.json'
+
+
+def read_haywired_tracts(haywired_file=HAYWIRED_TRACT_FILE):
+    """
+    Returns the HayWired damage by tract with an int64 tract_geoid column (Census_Tract is text with a leading 0).
+    """
+    haywired = pd.read_excel(haywired_file, dtype={'Census_Tract': str})
+    haywired['tract_geoid'] = haywired['Census_Tract'].astype(np.int64)
+    return haywired
+
+
+def build_hazard_store(slr_inundation, haywired, parcel_tract, store_dir, sources=None):
+    """
+    Write the hazard store to store_dir.
+    slr_inundation has parcel_id, inundation; haywired is from read_haywired_tracts(); parcel_tract has parcel_id, tract_geoid
+    and defines the parcels in the store. Parcels missing from slr_inundation get 0 (not inundated).
+    Returns the store metadata.
+    """
+    parcel_tract = parcel_tract.drop_duplicates(subset=['parcel_id']).sort_values('parcel_id')
+    parcel_id    = parcel_tract['parcel_id'].to_numpy(dtype=np.int64)
+
+    inundation = slr_inundation.drop_duplicates(subset=['parcel_id']).set_index('parcel_id')['inundation']
+    slr = inundation.reindex(parcel_id).fillna(0).to_numpy().astype(np.int16)
+
+    haywired   = haywired.drop_duplicates(subset=['tract_geoid']).sort_values('tract_geoid')
+    tract_code = pd.Index(haywired['tract_geoid']).get_indexer(parcel_tract['tract_geoid'].to_numpy()).astype(np.int32)
+
+    # parcels grouped by tract; parcels without a tract (-1) sort first, before starts[0], so no tract's slice includes them
+    order  = np.argsort(tract_code, kind='stable')
+    starts = np.searchsorted(tract_code[order], np.arange(len(haywired)+1))
+    arrays = {'parcel_id'          : parcel_id,
+              'slr_inundation'     : slr,
+              'tract_code'         : tract_code,
+              'tract_geoid'        : haywired['tract_geoid'].to_numpy(dtype=np.int64),
+              'tract_parcel_order' : order.astype(np.int64),
+              'tract_parcel_starts': starts.astype(np.int64)}
+    for col, name in HAYWIRED_DAMAGE_COLUMNS.items():
+        arrays[name] = haywired[col].to_numpy(dtype=np.float32)
+
+    os.makedirs(store_dir, exist_ok=True)
+    for name in STORE_ARRAYS:
+        np.save(os.path.join(store_dir, name+'.npy'), arrays[name])
+
+    metadata = {'parcels'           : len(parcel_id),
+                'tracts'            : len(haywired),
+                'parcels_without_tract': int((tract_code < 0).sum()),
+                'slr_levels'        : sorted(int(level) for level in np.unique(slr) if level > 0),
+                'arrays'            : STORE_ARRAYS,
+                'sources'           : sources or {}}
+    with open(os.path.join(store_dir, STORE_FILE), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+
+def load_hazard_store(store_dir):
+    """
+    Returns dict of the memory-mapped store arrays, plus 'metadata'.
+    """
+    store = dict((name, np.load(os.path.join(store_dir, name+'.npy'), mmap_mode='r')) for name in STORE_ARRAYS)
+    with open(os.path.join(store_dir, STORE_FILE)) as f:
+        store['metadata'] = json.load(f)
+    return store
+
+
+def parcel_rows(store, parcel_id):
+    """
+    Returns the store row of each parcel_id, -1 for parcels not in the store.
+    """
+    parcel_id = np.asarray(parcel_id, dtype=np.int64)
+    if len(store['parcel_id']) == 0:
+        return np.full(len(parcel_id), -1, dtype=np.int64)
+    rows = np.minimum(np.searchsorted(store['parcel_id'], parcel_id), len(store['parcel_id'])-1)
+    return np.where(np.asarray(store['parcel_id'])[rows] == parcel_id, rows, -1)
+
+
+def parcel_hazards(store, parcel_id):
+    """
+    Gather the hazards for parcel_id (e.g. the parcel_id of every building).
+    Returns dict of arrays: slr_inundation (0 if not inundated or not in the store) and the tract damage
+    shares (NaN where there's no tract).
+    """
+    rows = parcel_rows(store, parcel_id)
+    hazards = {'slr_inundation': np.where(rows >= 0, np.asarray(store['slr_inundation'])[rows], 0)}
+
+    tract_code = np.where(rows >= 0, np.asarray(store['tract_code'])[rows], -1)
+    for name in HAYWIRED_DAMAGE_COLUMNS.values():
+        damage = np.append(np.asarray(store[name], dtype=np.float64), np.nan)
+        hazards[name] = damage[tract_code]
+    return hazards
+
+
+def exposure_by_hazard(store, buildings, parcel_col='parcel_id', value_cols=['residential_units','non_residential_sqft']):
+    """
+    Exposure of building values (e.g. units, sqft) to each hazard.
+    Returns (slr_exposure, earthquake_exposure):
+      slr_exposure        - value_cols summed by the SLR level at which the buildings' parcels are first inundated
+                            (cumulative columns [col]_inundated_by give the total exposed at or below each level)
+      earthquake_exposure - value_cols total and expected damaged (value x tract damage share) for each damage type
+    """
+    hazards = parcel_hazards(store, buildings[parcel_col].to_numpy())
+    levels  = [0] + store['metadata']['slr_levels']
+    level_code = np.searchsorted(levels, hazards['slr_inundation'])
+
+    slr_exposure = pd.DataFrame({'slr_inundation': levels})
+    for col in value_cols:
+        values = np.nan_to_num(buildings[col].to_numpy(dtype=np.float64))
+        slr_exposure[col] = np.bincount(level_code, weights=values, minlength=len(levels))
+        slr_exposure[col+'_inundated_by'] = np.r_[0, np.cumsum(slr_exposure[col].to_numpy()[1:])]
+
+    earthquake_exposure = {}
+    for col in value_cols:
+        values = np.nan_to_num(buildings[col].to_numpy(dtype=np.float64))
+        earthquake_exposure[col] = values.sum()
+        for name in HAYWIRED_DAMAGE_COLUMNS.values():
+            earthquake_exposure[col+'_'+name[len('tract_'):]] = np.nansum(values * hazards[name])
+    return slr_exposure, pd.Series(earthquake_exposure)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter,)
+    parser.add_argument("parcel_tract_file",  help="Parcel to census tract crosswalk csv")
+    parser.add_argument("store_dir",          help="Output store directory")
+    parser.add_argument("--parcel_col",       default='parcel_id', help="Parcel id column in the crosswalk")
+    parser.add_argument("--tract_col",        default='tract',     help="Census tract GEOID column in the crosswalk")
+    parser.add_argument("--slr_inundation",   default=SLR_INUNDATION_FILE, help="slr_parcel_inundation.csv")
+    parser.add_argument("--haywired",         default=HAYWIRED_TRACT_FILE, help="HayWiredDestructionByCensusTract.xlsx")
+    args = parser.parse_args()
+
+    parcel_tract = pd.read_csv(args.parcel_tract_file, usecols=[args.parcel_col, args.tract_col], dtype={args.tract_col: str})
+    parcel_tract = parcel_tract.rename(columns={args.parcel_col: 'parcel_id', args.tract_col: 'tract_geoid'}).dropna()
+    parcel_tract['tract_geoid'] = parcel_tract['tract_geoid'].astype(np.int64)
+
+    metadata = build_hazard_store(pd.read_csv(args.slr_inundation), read_haywired_tracts(args.haywired), parcel_tract, args.store_dir,
+                                  sources={'slr_inundation': args.slr_inundation, 'haywired': args.haywired,
+                                           'parcel_tract': args.parcel_tract_file})
+    print("Wrote hazard store for {:,} parcels and {:,} tracts to {}".format(metadata['parcels'], metadata['tracts'], args.store_dir))
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+USAGE = """
+  Attach parcel elevation (MEAN of the DEM zonal statistics in gis_output/[county]_DEM_parcel.csv) to a parcel table
+  such as run7224_parcel_data_2010.csv, for all counties at once.
+
+"""
+
+# The county DEM zonal outputs are loaded into one parcel_id-indexed table and attached to the parcel table with a
+# single reindex, rather than merging the full parcel table against each county's output.
+
+import argparse, os, re
+import pandas as pd
+import numpy as np
+
+from zonal_loader import discover_zonal_files, load_zonal_tables
+
+SLR_DIR         = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GIS_OUTPUT_DIR  = os.path.join(SLR_DIR, 'gis_output')
+
+DEM_FILE_PATTERN = re.compile(r'^(?P<county>[a-z]+)_DEM_parcel\.csv$')
+
+# zonal statistic attached to parcels, and its parcel column name
+ELEVATION_COLUMNS = {'MEAN':'elevation'}
+
+
+def read_parcel_elevation(gis_output_dir=GIS_OUTPUT_DIR, columns=list(ELEVATION_COLUMNS.keys()), workers=None):
+    """
+    Returns dataframe indexed by parcel_id with county and columns from the [county]_DEM_parcel.csv files.
+    A parcel in more than one county's output keeps the first county's values (in county name order).
+    """
+    files = discover_zonal_files(gis_output_dir, pattern=DEM_FILE_PATTERN)
+    elevation = load_zonal_tables(files, columns=columns, workers=workers).drop(columns=['level'])
+
+    duplicated = elevation['parcel_id'].duplicated()
+    if duplicated.any():
+        print("{:,} parcels are in more than one county DEM output; keeping the first".format(duplicated.sum()))
+        elevation = elevation.loc[~duplicated]
+    return elevation.set_index('parcel_id')
+
+
+def attach_elevation(parcels, elevation, parcel_col='parcel_id', columns=ELEVATION_COLUMNS):
+    """
+    Returns a copy of parcels with the elevation columns (renamed per columns) aligned on parcel_col with one reindex;
+    parcels without DEM output get NaN.
+    """
+    aligned = elevation.reindex(parcels[parcel_col].to_numpy())
+    parcels = parcels.copy()
+    for col, name in columns.items():
+        parcels[name] = aligned[col].to_numpy(dtype=np.float64)
+    return parcels
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter,)
+    parser.add_argument("parcel_file",      help="Parcel table with parcel_id, e.g. run7224_parcel_data_2010.csv")
+    parser.add_argument("output_file",      help="Output csv")
+    parser.add_argument("--gis_output_dir", help="Directory with the [county]_DEM_parcel.csv files", default=GIS_OUTPUT_DIR)
+    args = parser.parse_args()
+
+    parcels   = pd.read_csv(args.parcel_file)
+    elevation = read_parcel_elevation(args.gis_output_dir)
+    parcels   = attach_elevation(parcels, elevation)
+    parcels.to_csv(args.output_file, index=False)
+    print("Wrote {:,} parcels, {:,} with elevation, to {}".format(len(parcels), parcels['elevation'].notnull().sum(), args.output_file))
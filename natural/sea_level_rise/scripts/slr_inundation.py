@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+USAGE = """
+  Assign each parcel the sea level rise (inches) at which it is inundated, from the ArcGIS parcel x BCDC SLR
+  polygon outputs in gis_output ([county]_parcels_[level]in.csv), for all counties and levels at once.
+
+  Writes to the output directory:
+    slr_parcel_inundation.csv        - parcel_id, inundation for parcels in the region
+    [county]_parcel_inundation.csv   - parcel_id, slr[level] for each level (0 if not inundated at that level), slr
+    slr_parcel_county.csv            - with --parcel_data, residential units, job spaces and parcel count by county
+
+"""
+
+# A parcel is inundated at level L if it's in the [county]_parcels_[L]in.csv output. Only parcels inundated at the
+# highest level are included, and a parcel's inundation is the lowest level from which it's inundated at every
+# higher level, e.g. a parcel inundated at 77, 66 and 52 (but not 48) gets 52.
+#
+# Rather than merging the levels and looping over parcels, the (parcel x level) presence matrix is built with one
+# scatter and the inundation level comes from a reversed cumulative AND along the level axis.
+
+import argparse, os
+import pandas as pd
+import numpy as np
+
+from zonal_loader import discover_zonal_files, load_zonal_tables
+
+SLR_DIR         = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GIS_OUTPUT_DIR  = os.path.join(SLR_DIR, 'gis_output')
+OUTPUT_DIR      = os.path.join(SLR_DIR, 'output')
+
+# BCDC Adapting to Rising Tides SLR levels, in inches, and counties that must have gis output
+SLR_LEVELS = [12, 24, 36, 48, 52, 66, 77]
+COUNTIES   = ['alameda','contracosta','marin','napa','sanfrancisco','sanmateo','santaclara','solano','sonoma']
+
+
+def read_slr_parcels(counties=COUNTIES, levels=SLR_LEVELS, gis_output_dir=GIS_OUTPUT_DIR, workers=None):
+    """
+    Returns long dataframe with county (categorical, in counties order), parcel_id, level for every parcel in every
+    county/level gis output (see zonal_loader for which files are used).
+    Counties or levels that are found in gis_output_dir but not in counties/levels are included after them.
+    """
+    files = discover_zonal_files(gis_output_dir)
+    county_order = counties + sorted(set(files['county']) - set(counties))
+    missing = set((county, level) for county in counties for level in levels) - set(zip(files['county'], files['level']))
+    if missing:
+        raise ValueError("Missing SLR gis output for {}".format(sorted(missing)))
+
+    files = files.assign(county_order=files['county'].map(county_order.index)).sort_values(['county_order','level'])
+    slr_parcels = load_zonal_tables(files, columns=[], workers=workers)[['county','parcel_id','level']]
+    slr_parcels['county'] = pd.Categorical(slr_parcels['county'], categories=county_order)
+    return slr_parcels
+
+
+def inundation_levels(present, levels=SLR_LEVELS):
+    """
+    present is a boolean array (n_parcels, len(levels)) with levels in ascending order.
+    Returns int array (n_parcels,) of the lowest level from which the parcel is present at every higher level,
+    or 0 where the parcel isn't present at the highest level.
+    """
+    inundated_from = np.logical_and.accumulate(present[:, ::-1], axis=1)[:, ::-1]
+    levels = np.asarray(levels)
+    return np.where(inundated_from[:, -1], levels[np.argmax(inundated_from, axis=1)], 0)
+
+
+def parcel_inundation(slr_parcels, levels=None):
+    """
+    slr_parcels is a long table of county, parcel_id, level (from read_slr_parcels()); levels defaults to all its levels.
+    Returns dataframe with county, parcel_id, slr[level] columns (the level where present, else 0) from highest to
+    lowest level, and slr, for the parcels present at the highest level, in the order they first appear at that level.
+    """
+    levels    = sorted(slr_parcels['level'].unique()) if levels is None else sorted(levels)
+    level_idx = np.searchsorted(levels, slr_parcels['level'].to_numpy())
+    top       = level_idx == len(levels)-1
+
+    # parcels (keyed by county and parcel_id) at the highest level define the rows
+    county_code = slr_parcels['county'].cat.codes.to_numpy().astype(np.int64)
+    parcel_id   = slr_parcels['parcel_id'].to_numpy(dtype=np.int64)
+    key         = pd.MultiIndex.from_arrays([county_code, parcel_id])
+    parcels     = key[top].drop_duplicates()
+    row         = parcels.get_indexer(key)
+
+    present = np.zeros((len(parcels), len(levels)), dtype=bool)
+    present[row[row >= 0], level_idx[row >= 0]] = True
+
+    inundation = pd.DataFrame({'county'   : pd.Categorical.from_codes(parcels.get_level_values(0), categories=slr_parcels['county'].cat.categories),
+                               'parcel_id': parcels.get_level_values(1)})
+    for idx in reversed(range(len(levels))):
+        inundation['slr{}'.format(levels[idx])] = np.where(present[:, idx], levels[idx], 0)
+    inundation['slr'] = inundation_levels(present, levels)
+    return inundation
+
+
+def county_summary(inundation, parcel_data):
+    """
+    Residential units, job spaces and parcel count of inundated parcels by county.
+    parcel_data has parcel_id, total_residential_units, total_job_spaces (e.g. run7224_parcel_data_2010.csv).
+    """
+    parcel_data = parcel_data.set_index('parcel_id')[['total_residential_units','total_job_spaces']]
+    summary = inundation[['county','parcel_id']].join(parcel_data, on='parcel_id')
+    summary = summary.groupby('county', observed=True).agg(parcel_count=('parcel_id','size'),
+                                                           total_job_spaces=('total_job_spaces','sum'),
+                                                           total_residential_units=('total_residential_units','sum'))
+    return summary.reset_index()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter,)
+    parser.add_argument("--gis_output_dir", help="Directory with the [county]_parcels_[level]in.csv files", default=GIS_OUTPUT_DIR)
+    parser.add_argument("--output_dir",     help="Output directory", default=OUTPUT_DIR)
+    parser.add_argument("--workers",        help="Number of files to read concurrently", type=int)
+    parser.add_argument("--parcel_data",    help="Parcel data with total_residential_units, total_job_spaces for the county summary")
+    args = parser.parse_args()
+
+    inundation = parcel_inundation(read_slr_parcels(gis_output_dir=args.gis_output_dir, workers=args.workers))
+
+    inundation[['parcel_id','slr']].rename(columns={'slr':'inundation'}).to_csv(
+        os.path.join(args.output_dir, 'slr_parcel_inundation.csv'), index=False)
+    for county, county_inundation in inundation.groupby('county', observed=True):
+        county_inundation.drop(columns=['county']).reset_index(drop=True).to_csv(
+            os.path.join(args.output_dir, county+'_parcel_inundation.csv'))
+    print("Wrote inundation for {:,} parcels to {}".format(len(inundation), args.output_dir))
+
+    if args.parcel_data:
+        county_summary(inundation, pd.read_csv(args.parcel_data)).to_csv(os.path.join(args.output_dir, 'slr_parcel_county.csv'))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Load the ArcGIS zonal outputs in gis_output ([county]_parcels_[level]in[_variant].csv) into one long table.
+#
+# Files are discovered by pattern, so a new SLR level or a county re-run needs no code. Where a county/level has
+# several files, the first variant in VARIANT_PREFERENCE is used (e.g. contracosta_parcels_48in_updated.csv
+# over contracosta_parcels_48in.csv); other variants (e.g. _2, _nodata) are ignored.
+# The parcel id column ('VALUE' or 'Value' depending on the county) is renamed to parcel_id, only the requested
+# columns are read, and the files are read concurrently.
+
+import concurrent.futures, os, re
+import pandas as pd
+import numpy as np
+
+ZONAL_FILE_PATTERN = re.compile(r'^(?P<county>[a-z]+)_parcels_(?P<level>\d+)in(?P<variant>_[A-Za-z0-9]+)?\.csv$')
+
+# file variants to use, in order of preference; '' is the original output
+VARIANT_PREFERENCE = ['_updated', '']
+
+# parcel id column in the ArcGIS zonal outputs
+ZONAL_KEY_COLUMNS = ['VALUE','Value']
+
+
+def discover_zonal_files(gis_output_dir, pattern=ZONAL_FILE_PATTERN, variant_preference=VARIANT_PREFERENCE):
+    """
+    Returns dataframe with county, level, variant, file for the zonal output files in gis_output_dir,
+    one per (county, level), sorted by county and level. pattern must have a county group; files matched by
+    patterns without level or variant groups (e.g. [county]_DEM_parcel.csv) get level 0 and variant ''.
+    """
+    found = []
+    for file_name in os.listdir(gis_output_dir):
+        match = pattern.match(file_name)
+        if match is None:
+            continue
+        variant = (match.group('variant') if 'variant' in pattern.groupindex else None) or ''
+        if variant not in variant_preference:
+            continue
+        found.append({'county'    : match.group('county'),
+                      'level'     : int(match.group('level')) if 'level' in pattern.groupindex else 0,
+                      'variant'   : variant,
+                      'preference': variant_preference.index(variant),
+                      'file'      : os.path.join(gis_output_dir, file_name)})
+
+    files = pd.DataFrame(found, columns=['county','level','variant','preference','file'])
+    files = files.sort_values(['county','level','preference']).drop_duplicates(subset=['county','level'])
+    return files.drop(columns=['preference']).reset_index(drop=True)
+
+
+def read_zonal_file(zonal_file, columns=None):
+    """
+    Read an ArcGIS zonal output csv with the parcel id column renamed to parcel_id.
+    columns optionally limits the other columns read (e.g. ['MEAN']).
+    """
+    header = pd.read_csv(zonal_file, nrows=0).columns
+    key = header.intersection(ZONAL_KEY_COLUMNS)
+    if len(key) == 0:
+        raise ValueError("{} has none of the parcel id columns {}".format(zonal_file, ZONAL_KEY_COLUMNS))
+    usecols = [key[0]] + ([col for col in header if col in columns] if columns is not None else
+                          [col for col in header if col != key[0]])
+    zonal = pd.read_csv(zonal_file, usecols=usecols, dtype={key[0]: np.int64})
+    return zonal.rename(columns={key[0]: 'parcel_id'})
+
+
+def load_zonal_tables(files, columns=None, workers=None):
+    """
+    Read files (from discover_zonal_files()) concurrently.
+    Returns long dataframe with county, level, parcel_id and columns, in the order of files.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as executor:
+        tables = list(executor.map(lambda zonal_file: read_zonal_file(zonal_file, columns), files['file']))
+
+    for table, county, level in zip(tables, files['county'], files['level']):
+        table.insert(0, 'county', county)
+        table.insert(1, 'level',  level)
+
+    if not tables:
+        return pd.DataFrame(columns=['county','level','parcel_id'] + (columns or []))
+    return pd.concat(tables, ignore_index=True)
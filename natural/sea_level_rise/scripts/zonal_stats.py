@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+USAGE = """
+  Zonal statistics of a value raster (e.g. a DEM or an SLR depth grid) over a rasterized parcel id grid,
+  in place of the ArcGIS Zonal Statistics as Table step that produced the gis_output csvs.
+
+  Both rasters are .npy files of the same shape, memory-mapped and processed in row tiles, so the
+  rasters don't need to fit in memory. Writes a csv with the ArcGIS columns VALUE (parcel id), COUNT, AREA,
+  MIN, MAX, RANGE, MEAN, STD, SUM.
+
+  --self_check runs the engine on synthetic rasters and compares it with a pandas groupby.
+
+"""
+
+# Each tile sorts its valid cells by zone and accumulates per-zone count, sum, sum of squares, min and max with one
+# ufunc reduceat each. Tiles are processed in a process pool; each worker opens the memory-mapped rasters itself and
+# returns only the zones present in its tile, and the tile results are reduced by zone the same way.
+# STD is the population standard deviation, as in ArcGIS.
+
+import argparse, concurrent.futures, os, shutil, tempfile
+import pandas as pd
+import numpy as np
+
+ZONAL_STATS_COLUMNS = ['VALUE','COUNT','AREA','MIN','MAX','RANGE','MEAN','STD','SUM']
+
+# zone id for cells outside any parcel
+ZONE_NODATA = 0
+TILE_ROWS   = 1024
+
+
+def tile_stats(zone_file, value_file, row_start, row_end, value_nodata=None):
+    """
+    Accumulate statistics for rows [row_start, row_end) of the rasters.
+    Returns (zones, count, sum, sumsq, min, max) for the zones present in the tile.
+    """
+    zones  = np.load(zone_file,  mmap_mode='r')[row_start:row_end].ravel()
+    values = np.load(value_file, mmap_mode='r')[row_start:row_end].ravel().astype(np.float64)
+
+    valid = (zones != ZONE_NODATA) & np.isfinite(values)
+    if value_nodata is not None:
+        valid &= values != value_nodata
+    zones, values = zones[valid].astype(np.int64), values[valid]
+    if len(zones) == 0:
+        empty = np.zeros(0)
+        return np.zeros(0, dtype=np.int64), empty, empty, empty, empty, empty
+
+    order  = np.argsort(zones, kind='stable')
+    zones, values = zones[order], values[order]
+    starts = np.flatnonzero(np.r_[True, zones[1:] != zones[:-1]])
+
+    return (zones[starts],
+            np.diff(np.r_[starts, len(zones)]).astype(np.float64),
+            np.add.reduceat(values, starts),
+            np.add.reduceat(values * values, starts),
+            np.minimum.reduceat(values, starts),
+            np.maximum.reduceat(values, starts))
+
+
+def zonal_stats(zone_file, value_file, cell_area=1.0, value_nodata=None, tile_rows=TILE_ROWS, workers=None):
+    """
+    Zonal statistics of the value raster over the zone raster (both .npy files of the same 2D shape).
+    Returns dataframe with ZONAL_STATS_COLUMNS, one row per zone with at least one valid cell, sorted by zone.
+    """
+    zone_shape  = np.load(zone_file,  mmap_mode='r').shape
+    value_shape = np.load(value_file, mmap_mode='r').shape
+    if zone_shape != value_shape:
+        raise ValueError("Zone raster shape {} doesn't match value raster shape {}".format(zone_shape, value_shape))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(tile_stats, zone_file, value_file, row_start, min(row_start+tile_rows, zone_shape[0]), value_nodata)
+                   for row_start in range(0, zone_shape[0], tile_rows)]
+        tiles = [future.result() for future in futures]
+
+    # combine the tiles: zones are unique within a tile, so the per-tile results are stacked and reduced by zone
+    if not tiles or sum(len(tile[0]) for tile in tiles) == 0:
+        return pd.DataFrame(columns=ZONAL_STATS_COLUMNS)
+    zones   = np.concatenate([tile[0] for tile in tiles])
+    stacked = [np.concatenate([tile[idx] for tile in tiles]) for idx in range(1, 6)]
+
+    order  = np.argsort(zones, kind='stable')
+    zones  = zones[order]
+    starts = np.flatnonzero(np.r_[True, zones[1:] != zones[:-1]])
+    count, total, sumsq = [np.add.reduceat(values[order], starts) for values in stacked[:3]]
+    low  = np.minimum.reduceat(stacked[3][order], starts)
+    high = np.maximum.reduceat(stacked[4][order], starts)
+
+    mean = total / count
+    std  = np.sqrt(np.clip(sumsq / count - mean * mean, 0, None))
+    return pd.DataFrame({'VALUE': zones[starts],
+                         'COUNT': count.astype(np.int64),
+                         'AREA' : count * cell_area,
+                         'MIN'  : low,
+                         'MAX'  : high,
+                         'RANGE': high - low,
+                         'MEAN' : mean,
+                         'STD'  : std,
+                         'SUM'  : total})
+
+
+def synthetic_rasters(output_dir, shape=(2500, 1800), n_zones=5000, seed=0):
+    """
+    Write a synthetic zone raster (blocky parcels with ids 1..n_zones, plus ZONE_NODATA cells) and a value raster
+    (a smooth surface plus noise, with some NaN cells) to output_dir. Returns (zone_file, value_file).
+    """
+    rng  = np.random.default_rng(seed)
+    rows = np.sort(rng.integers(0, shape[0], size=int(np.sqrt(n_zones))))
+    cols = np.sort(rng.integers(0, shape[1], size=int(np.sqrt(n_zones))))
+    block_row = np.searchsorted(rows, np.arange(shape[0]), side='right')
+    block_col = np.searchsorted(cols, np.arange(shape[1]), side='right')
+    zones = (block_row[:, None] * (len(cols)+1) + block_col[None, :]) % n_zones + 1
+    zones[rng.random(shape) < 0.05] = ZONE_NODATA
+
+    y, x   = np.mgrid[0:shape[0], 0:shape[1]]
+    values = 50 * np.sin(y / 300.0) + 30 * np.cos(x / 200.0) + rng.normal(0, 2, size=shape)
+    values[rng.random(shape) < 0.01] = np.nan
+
+    zone_file  = os.path.join(output_dir, 'zones.npy')
+    value_file = os.path.join(output_dir, 'values.npy')
+    np.save(zone_file,  zones.astype(np.int32))
+    np.save(value_file, values.astype(np.float32))
+    return zone_file, value_file
+
+
+def self_check(tile_rows=317, workers=None):
+    """
+    Compare zonal_stats() on synthetic rasters (with a tile size that doesn't divide the rows) against pandas.
+    """
+    temp_dir = tempfile.mkdtemp(prefix='zonal_stats_')
+    try:
+        zone_file, value_file = synthetic_rasters(temp_dir)
+        stats = zonal_stats(zone_file, value_file, cell_area=4.0, tile_rows=tile_rows, workers=workers)
+
+        cells = pd.DataFrame({'VALUE': np.load(zone_file).ravel(), 'value': np.load(value_file).ravel().astype(np.float64)})
+        cells = cells.loc[(cells['VALUE'] != ZONE_NODATA) & cells['value'].notnull()]
+        expected = cells.groupby('VALUE')['value'].agg(['count','min','max','mean','sum']).reset_index()
+        expected['std'] = cells.groupby('VALUE')['value'].std(ddof=0).to_numpy()
+
+        assert (stats['VALUE'].to_numpy() == expected['VALUE'].to_numpy()).all()
+        assert (stats['COUNT'].to_numpy() == expected['count'].to_numpy()).all()
+        assert np.allclose(stats['AREA'], expected['count'] * 4.0)
+        for col, expected_col in [('MIN','min'), ('MAX','max'), ('MEAN','mean'), ('SUM','sum'), ('STD','std')]:
+            assert np.allclose(stats[col], expected[expected_col], rtol=1e-6, atol=1e-6), col
+        assert np.allclose(stats['RANGE'], expected['max'] - expected['min'])
+    finally:
+        shutil.rmtree(temp_dir)
+    print("Self check passed for {:,} zones".format(len(stats)))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter,)
+    parser.add_argument("zone_file",      nargs='?', help="Rasterized parcel id grid (.npy); 0 is outside parcels")
+    parser.add_argument("value_file",     nargs='?', help="Value raster (.npy) of the same shape")
+    parser.add_argument("output_file",    nargs='?', help="Output csv")
+    parser.add_argument("--cell_area",    type=float, default=1.0, help="Area of a raster cell, for AREA")
+    parser.add_argument("--value_nodata", type=float, help="Value raster nodata value (NaN is always nodata)")
+    parser.add_argument("--tile_rows",    type=int, default=TILE_ROWS, help="Raster rows per tile")
+    parser.add_argument("--workers",      type=int, help="Number of worker processes")
+    parser.add_argument("--self_check",   action="store_true", help="Run on synthetic rasters and compare with pandas")
+    args = parser.parse_args()
+
+    if args.self_check:
+        self_check(workers=args.workers)
+    else:
+        if not (args.zone_file and args.value_file and args.output_file):
+            parser.error("zone_file, value_file and output_file are required")
+        stats = zonal_stats(args.zone_file, args.value_file, cell_area=args.cell_area,
+                            value_nodata=args.value_nodata, tile_rows=args.tile_rows, workers=args.workers)
+        stats.to_csv(args.output_file, index=False)
+        print("Wrote stats for {:,} zones to {}".format(len(stats), args.output_file))
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Rule tables for assigning PBA50 inclusionary levels from the BluePrint strategy attributes
+# (gg_id, tra_id, sesit_id, ppa_id in p10_pba50_attr_*.csv).
+#
+# Each policy variant is a list of rules; a rule gives a condition on each attribute (see policy_overlay for the
+# condition forms) and the inclusionary level for matching rows. Rules are checked in order and the first match wins;
+# rows matching no rule get the variant default.
+#
+# All variants are resolved together by policy_overlay on the distinct attribute combinations and gathered back onto
+# the rows, so the same code serves the pba50chcat categories or all parcels in the region.
+
+import functools
+
+from policy_overlay import build_overlay_index, resolve_policies, resolve_rules
+
+RULE_ATTRIBUTES = ['gg_id','tra_id','sesit_id','ppa_id']
+
+# the minimum requirement
+DEFAULT_INCLUSIONARY = 0.10
+
+TRA_HRA_20      = ('tra1','tra2','tra3','tra2c1','tra3c1','tra3c2')
+TRA_15          = ('tra1','tra2','tra2c1')
+TRA_15_CROSSING = ('tra1','tra2','tra2c1','tra3c1','tra3c2')
+
+# variant -> list of ((gg_id, tra_id, sesit_id, ppa_id), inclusionary)
+# s20-s22 are without the crossing, s23 is with the crossing
+INCLUSIONARY_RULES = {
+    'noCrossing': [(('GG', TRA_HRA_20,      'HRA', None), 0.20),
+                   (('GG', TRA_15,          None,  None), 0.15),
+                   (('GG', None,            'HRA', None), 0.15)],
+    'crossing'  : [(('GG', TRA_HRA_20,      'HRA', None), 0.20),
+                   (('GG', TRA_15_CROSSING, None,  None), 0.15),
+                   (('GG', None,            'HRA', None), 0.15)]}
+
+
+def assign_levels(df, variant_rules=INCLUSIONARY_RULES, default=DEFAULT_INCLUSIONARY,
+                  attributes=RULE_ATTRIBUTES, prefix='inclusionary_'):
+    """
+    Evaluate every variant in variant_rules (variant -> rule list) on the rows of df.
+    Returns dataframe with the same index as df and one [prefix][variant] column per variant.
+    """
+    overlay_index = build_overlay_index(df, attributes)
+    levels = resolve_policies(overlay_index, dict(
+        (prefix+variant, functools.partial(resolve_rules, rules=rules, rule_attributes=attributes, default=default))
+        for variant, rules in variant_rules.items()))
+    levels.index = df.index
+    return levels
@@ -1,63 +1,50 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+USAGE = """
+  Assign PBA50 inclusionary levels (see inclusionary_rules.INCLUSIONARY_RULES) to pba50chcat categories,
+  writing pab50_inclusionary_[variant].csv for each variant.
+
+  With --parcel_output, also write the inclusionary level of every parcel (geom_id_s) for all variants.
+
+"""
+
+import argparse
 import pandas as pd
-import numpy as np
+
+from inclusionary_rules import INCLUSIONARY_RULES, RULE_ATTRIBUTES, assign_levels
 
 # raw data: 'p10_pba50_attr_20200416.csv' at https://mtcdrive.app.box.com/file/654543170007
-zoningmod = pd.read_csv(r'C:\Users\ywang\Documents\Files_for_Py\UrbanSim_input_Zoning\inputs\p10_pba50_attr_20200416.csv',usecols = ['pba50chcat','gg_id','tra_id','sesit_id', 'ppa_id'])
-zoningmod.drop_duplicates(inplace = True)
-
-# set default as 0.1 which is the minumum requirement
-zoningmod['inclusionary'] = 0.10
-
-zoningmod_noCrossing = zoningmod.copy()
-zoningmod_crossing = zoningmod.copy()
-
-min_20_idx = (zoningmod['gg_id'] == 'GG') & (
-                (zoningmod['tra_id'] == 'tra1')   | (
-                 zoningmod['tra_id'] == 'tra2')   | (
-                 zoningmod['tra_id'] == 'tra3')   | (
-                 zoningmod['tra_id'] == 'tra2c1') | (
-                 zoningmod['tra_id'] == 'tra3c1') | (
-                 zoningmod['tra_id'] == 'tra3c2')) & (
-               zoningmod['sesit_id'] == 'HRA') & (
-               zoningmod['ppa_id'].isnull())
-
-min_15_idx_1_noCrossing = (zoningmod['gg_id'] == 'GG') & (
-                            (zoningmod['tra_id'] == 'tra1') | (
-                             zoningmod['tra_id'] == 'tra2') | (
-                             zoningmod['tra_id'] == 'tra2c1')) & (
-                           zoningmod['sesit_id'].isnull()) & (
-                           zoningmod['ppa_id'].isnull())
-
-min_15_idx_1_crossing = (zoningmod['gg_id'] == 'GG') & (
-                          (zoningmod['tra_id'] == 'tra1')   | (
-                           zoningmod['tra_id'] == 'tra2')   | (
-                           zoningmod['tra_id'] == 'tra2c1') | (
-                           zoningmod['tra_id'] == 'tra3c1') | (
-                           zoningmod['tra_id'] == 'tra3c2')) & (
-                         zoningmod['sesit_id'].isnull()) & (
-                         zoningmod['ppa_id'].isnull())
-
-min_15_idx_2 = (zoningmod_noCrossing['gg_id'] == 'GG') & (
-                zoningmod_noCrossing['tra_id'].isnull()
-                ) & (zoningmod_noCrossing['sesit_id'] == 'HRA'
-                ) & (zoningmod_noCrossing['ppa_id'].isnull())
-
-zoningmod_noCrossing.loc[min_20_idx,'inclusionary'] = 0.20
-zoningmod_noCrossing.loc[min_15_idx_1_noCrossing,'inclusionary'] = 0.15
-zoningmod_noCrossing.loc[min_15_idx_2,'inclusionary'] = 0.15
-
-zoningmod_crossing.loc[min_20_idx,'inclusionary'] = 0.20
-zoningmod_crossing.loc[min_15_idx_1_crossing,'inclusionary'] = 0.15
-zoningmod_crossing.loc[min_15_idx_2,'inclusionary'] = 0.15
-
-## sort to view pba50chcat by inclusionary level
-zoningmod_noCrossing.sort_values(by=['inclusionary','pba50chcat'], inplace = True)
-zoningmod_crossing.sort_values(by=['inclusionary','pba50chcat'], inplace = True)
-
-
-## export
-zoningmod_noCrossing.to_csv('pab50_inclusionary_noCrossing.csv')
-zoningmod_crossing.to_csv('pab50_inclusionary_crossing.csv')
+PBA50_ATTR_FILE = r'C:\Users\ywang\Documents\Files_for_Py\UrbanSim_input_Zoning\inputs\p10_pba50_attr_20200416.csv'
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter,)
+    parser.add_argument("--pba50_attr_file", help="p10_pba50_attr file", default=PBA50_ATTR_FILE)
+    parser.add_argument("--parcel_output",   help="Parcel-level output file (csv)")
+    args = parser.parse_args()
+
+    usecols = ['pba50chcat'] + RULE_ATTRIBUTES + (['geom_id_s'] if args.parcel_output else [])
+    pba50_attr = pd.read_csv(args.pba50_attr_file, usecols=usecols)
+
+    # all variants in one pass, on every parcel
+    levels = assign_levels(pba50_attr)
+
+    # one row per distinct category, in the input column order
+    category_cols = [col for col in pba50_attr.columns if col != 'geom_id_s']
+    zoningmod = pd.concat([pba50_attr[category_cols], levels], axis=1).drop_duplicates(subset=category_cols)
+
+    for variant in INCLUSIONARY_RULES.keys():
+        zoningmod_variant = zoningmod[category_cols + ['inclusionary_'+variant]].rename(
+            columns={'inclusionary_'+variant: 'inclusionary'})
+
+        ## sort to view pba50chcat by inclusionary level
+        zoningmod_variant.sort_values(by=['inclusionary','pba50chcat'], inplace = True)
+
+        ## export
+        zoningmod_variant.to_csv('pab50_inclusionary_'+variant+'.csv')
+
+    if args.parcel_output:
+        pd.concat([pba50_attr[['geom_id_s']], levels], axis=1).to_csv(args.parcel_output, index=False)
+        print("Wrote {:,} parcels to {}".format(len(levels), args.parcel_output))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Evaluate policy levers on the PBA50 BluePrint overlay attributes of parcels (p10_pba50_attr_*.csv).
+#
+# Each overlay attribute is encoded once as categorical codes and the distinct combinations of codes form an
+# overlay index: every row gets an overlay key (0..n_overlays-1) and every overlay has one code per attribute.
+# Policy levers are then resolved on the (few thousand) overlays rather than the (~2M) parcels and gathered back
+# with the overlay key, so adding a lever only costs its own small table:
+#  * resolve_rules()  - ordered rule tables of attribute conditions -> value (e.g. inclusionary levels)
+#  * resolve_lookup() - tables keyed on attribute values (e.g. fees by pba50chcat, zoningmods by pba50zoningmodcat)
+#
+# Rule conditions are one of:
+#   ANY                - matches anything, including null
+#   None               - matches null
+#   'GG'               - matches that value
+#   ('tra1','tra2',..) - matches any of those values
+
+import pandas as pd
+import numpy as np
+
+ANY = '*'
+
+OVERLAY_ATTRIBUTES = ['gg_id','tra_id','sesit_id','ppa_id','exp2020_id','exsfd_id','pba50chcat']
+
+
+def build_overlay_index(df, attributes=OVERLAY_ATTRIBUTES):
+    """
+    Encode the overlay attributes of df and index their distinct combinations.
+    Returns dict with
+      attributes    - the attribute names
+      categories    - list of category values for each attribute
+      overlay_codes - int array (n_attributes, n_overlays) of categorical codes, -1 for null
+      overlay_key   - int array (len(df),) of each row's overlay
+    """
+    codes, categories = [], []
+    for attribute in attributes:
+        categorical = pd.Categorical(df[attribute])
+        codes.append(categorical.codes.astype(np.int64))
+        categories.append(list(categorical.categories))
+
+    if not codes:
+        return {'attributes': [], 'categories': [], 'overlay_codes': np.zeros((0, 1), dtype=np.int64),
+                'overlay_key': np.zeros(len(df), dtype=np.int64)}
+
+    overlay_codes, overlay_key = np.unique(np.stack(codes), axis=1, return_inverse=True)
+
+    return {'attributes'   : list(attributes),
+            'categories'   : categories,
+            'overlay_codes': overlay_codes,
+            'overlay_key'  : overlay_key.reshape(-1)}
+
+
+def overlay_table(overlay_index):
+    """
+    Returns dataframe with one row per overlay and the attribute values (NaN for null).
+    """
+    table = {}
+    for attr_idx, attribute in enumerate(overlay_index['attributes']):
+        table[attribute] = pd.Categorical.from_codes(overlay_index['overlay_codes'][attr_idx],
+                                                     categories=overlay_index['categories'][attr_idx])
+    return pd.DataFrame(table)
+
+
+def compile_condition(condition, categories):
+    """
+    Returns a boolean lookup of length len(categories)+1 for one attribute condition; the last entry is for null,
+    so it can be indexed directly with categorical codes.
+    """
+    if condition == ANY:
+        return np.ones(len(categories)+1, dtype=bool)
+    if condition is None:
+        lookup = np.zeros(len(categories)+1, dtype=bool)
+        lookup[-1] = True
+        return lookup
+    values = [condition] if isinstance(condition, str) else list(condition)
+    return np.append(np.isin(np.array(categories, dtype=object), values), False)
+
+
+def resolve_rules(overlay_index, rules, rule_attributes, default):
+    """
+    Resolve an ordered rule table on the overlays. rules is a list of (conditions, value) with one condition per
+    rule_attributes entry; the first matching rule wins and overlays matching no rule get default.
+    Returns float array (n_overlays,); gather with overlay_index['overlay_key'] for row values.
+    """
+    attr_idx   = [overlay_index['attributes'].index(attribute) for attribute in rule_attributes]
+    n_overlays = overlay_index['overlay_codes'].shape[1]
+
+    values  = np.full(n_overlays, default, dtype=np.float64)
+    matched = np.zeros(n_overlays, dtype=bool)
+    for conditions, value in rules:
+        if len(conditions) != len(rule_attributes):
+            raise ValueError("Rule {} has {} conditions; expected {}".format(conditions, len(conditions), len(rule_attributes)))
+        match = ~matched
+        for idx, condition in zip(attr_idx, conditions):
+            match &= compile_condition(condition, overlay_index['categories'][idx])[overlay_index['overlay_codes'][idx]]
+        values[match]  = value
+        matched       |= match
+    return values
+
+
+def resolve_lookup(overlay_index, table, attribute, value_col, default=np.nan):
+    """
+    Resolve a table keyed on one overlay attribute (e.g. fees by pba50chcat) on the overlays.
+    Returns array (n_overlays,) of table[value_col], default for overlays whose attribute is null or not in the table.
+    """
+    idx    = overlay_index['attributes'].index(attribute)
+    table  = table.drop_duplicates(subset=[attribute]).set_index(attribute)[value_col]
+    lookup = np.append(table.reindex(overlay_index['categories'][idx]).to_numpy(dtype=object), None)
+    values = lookup[overlay_index['overlay_codes'][idx]]
+    values = np.where(pd.isnull(values), default, values)
+    return values.astype(np.float64) if table.dtype.kind in 'biuf' else values
+
+
+def resolve_policies(overlay_index, policies):
+    """
+    Resolve several policy levers at once.
+    policies is a dict of output column -> function(overlay_index) returning per-overlay values
+    (e.g. functools.partial(resolve_rules, ...)).
+    Returns dataframe with one row per row of the indexed data and one column per policy.
+    """
+    resolved = {}
+    for col, resolve in policies.items():
+        resolved[col] = np.asarray(resolve(overlay_index))[overlay_index['overlay_key']]
+    return pd.DataFrame(resolved)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Development capacity engine: evaluates residential units, non-residential sqft, Ksqft and employment
+# for any number of zoning sources (e.g. 'pba40', 'basis', or several hybrid versions of 'basis') at once.
+#
+# Each zoning source is stacked into a (n_sources, n_parcels) NumPy array so that the allowed building type
+# sums and the capacity math are done in a single pass, rather than copying the parcel table once per source
+# and merging the per-source results back together.
+#
+# The calculation follows the original calculate_capacity() of 3_dev_capacity_calculation.py and
+# pba50zoningmod_capacity_calculation.ipynb (which now both use this engine):
+#  * units = ACRES * max_dua, zeroed out for 'nodev' parcels and parcels that don't allow residential
+#  * sqft  = ACRES * max_far * SQUARE_FEET_PER_ACRE, zeroed out for 'nodev' parcels and parcels that don't allow non-residential
+#  * emp   = sqft / sqft-per-employee, where office-only and industrial-only parcels use their own sqft-per-employee
+
+import pandas as pd
+import numpy as np
+
+ALLOWED_BUILDING_TYPE_CODES = ["HS","HT","HM","OF","HO","SC","IL","IW","IH","RS","RB","MR","MT","ME"]
+RES_BUILDING_TYPE_CODES     = ["HS","HT","HM",                                        "MR"          ]
+NONRES_BUILDING_TYPE_CODES  = [               "OF","HO","SC","IL","IW","IH","RS","RB","MR","MT","ME"]
+INDUST_BUILDING_TYPE_CODES  = [                              "IL","IW","IH"                         ]
+
+# used in capacity_from_arrays()
+SQUARE_FEET_PER_ACRE                = 43560.0
+SQUARE_FEET_PER_EMPLOYEE            = 350.0
+SQUARE_FEET_PER_EMPLOYEE_OFFICE     = 175.0
+SQUARE_FEET_PER_EMPLOYEE_INDUSTRIAL = 500.0
+
+# positions of building type groups within ALLOWED_BUILDING_TYPE_CODES
+RES_TYPE_IDX    = [ALLOWED_BUILDING_TYPE_CODES.index(btype) for btype in RES_BUILDING_TYPE_CODES]
+NONRES_TYPE_IDX = [ALLOWED_BUILDING_TYPE_CODES.index(btype) for btype in NONRES_BUILDING_TYPE_CODES]
+INDUST_TYPE_IDX = [ALLOWED_BUILDING_TYPE_CODES.index(btype) for btype in INDUST_BUILDING_TYPE_CODES]
+OFFICE_TYPE_IDX = ALLOWED_BUILDING_TYPE_CODES.index("OF")
+
+# capacity attributes returned for each source, in output column order
+CAPACITY_ATTRIBUTES = ['allow_res', 'units', 'allow_nonres', 'sqft', 'Ksqft', 'emp']
+
+
+def stack_zoning_sources(df, boc_sources):
+    """
+    Stack the allowed building type and intensity columns for each boc_source into arrays.
+    Columns are expected to be named [btype]_[boc_source], max_dua_[boc_source] and max_far_[boc_source].
+    Returns (types, max_dua, max_far) where types has shape (n_sources, n_parcels, n_types) with
+    missing values filled with 0, and max_dua/max_far have shape (n_sources, n_parcels).
+    """
+    n_parcels = len(df)
+    types   = np.empty((len(boc_sources), n_parcels, len(ALLOWED_BUILDING_TYPE_CODES)), dtype=np.float64)
+    max_dua = np.empty((len(boc_sources), n_parcels), dtype=np.float64)
+    max_far = np.empty((len(boc_sources), n_parcels), dtype=np.float64)
+
+    for source_idx, boc_source in enumerate(boc_sources):
+        types[source_idx]   = df[[btype+'_'+boc_source for btype in ALLOWED_BUILDING_TYPE_CODES]].to_numpy(dtype=np.float64)
+        max_dua[source_idx] = df['max_dua_'+boc_source].to_numpy(dtype=np.float64)
+        max_far[source_idx] = df['max_far_'+boc_source].to_numpy(dtype=np.float64)
+
+    # allowed building types can't be null because then they won't sum
+    np.nan_to_num(types, copy=False, nan=0.0)
+    return types, max_dua, max_far
+
+
+def capacity_from_arrays(acres, nodev, types, max_dua, max_far):
+    """
+    Calculate capacity for stacked zoning sources.
+    acres and nodev have shape (n_parcels,); nodev is true for parcels that can't be developed.
+    types, max_dua, max_far are as returned by stack_zoning_sources().
+    Returns a dict of CAPACITY_ATTRIBUTES to arrays of shape (n_sources, n_parcels).
+    """
+    allow_res    = types[:, :, RES_TYPE_IDX   ].sum(axis=2)
+    allow_nonres = types[:, :, NONRES_TYPE_IDX].sum(axis=2)
+    allow_indust = types[:, :, INDUST_TYPE_IDX].sum(axis=2)
+
+    # DUA calculations apply to parcels 'allowRes' and not marked as "nodev"
+    units = acres * max_dua
+    units[(allow_res == 0) | nodev] = 0
+
+    # FAR calculations apply to parcels 'allowNonRes' and not marked as "nodev"
+    sqft = acres * max_far * SQUARE_FEET_PER_ACRE
+    sqft[(allow_nonres == 0) | nodev] = 0
+
+    # of nonresidential uses, only office allowed
+    office_idx = (types[:, :, OFFICE_TYPE_IDX] == 1) & (allow_nonres == 1)
+    # of nonresidential uses, only industrial allowed; this takes precedence over office
+    indust_idx = (allow_indust > 0) & (allow_nonres == allow_indust)
+
+    sqft_per_emp = np.where(indust_idx, SQUARE_FEET_PER_EMPLOYEE_INDUSTRIAL,
+                   np.where(office_idx, SQUARE_FEET_PER_EMPLOYEE_OFFICE,
+                                        SQUARE_FEET_PER_EMPLOYEE))
+
+    return {'allow_res'   : allow_res,
+            'units'       : units,
+            'allow_nonres': allow_nonres,
+            'sqft'        : sqft,
+            'Ksqft'       : sqft*0.001,
+            'emp'         : sqft / sqft_per_emp}
+
+
+def calculate_capacity_multi(df, boc_sources, nodev_source, long_format=False):
+    """
+    Calculate capacity for all boc_sources in one pass.
+    Returns dataframe indexed like df with PARCEL_ID and, for each boc_source, the columns
+    [source_dua_]allow_res_, units_, allow_nonres_, [source_far_]sqft_, Ksqft_, emp_ suffixed with the boc_source
+    (source_dua_ and source_far_ are included if they're in df).
+    If long_format, returns one row per (PARCEL_ID, boc_source) with the CAPACITY_ATTRIBUTES columns instead.
+    """
+    acres = df['ACRES'].to_numpy(dtype=np.float64)
+    nodev = (df['nodev_'+nodev_source] == 1).to_numpy()
+
+    types, max_dua, max_far = stack_zoning_sources(df, boc_sources)
+    capacity = capacity_from_arrays(acres, nodev, types, max_dua, max_far)
+
+    if long_format:
+        n_parcels = len(df)
+        long_df = pd.DataFrame({
+            'PARCEL_ID' : np.tile(df['PARCEL_ID'].to_numpy(), len(boc_sources)),
+            'boc_source': pd.Categorical.from_codes(np.repeat(np.arange(len(boc_sources)), n_parcels),
+                                                    categories=boc_sources)})
+        for attr in CAPACITY_ATTRIBUTES:
+            long_df[attr] = capacity[attr].ravel()
+        return long_df
+
+    columns = {'PARCEL_ID': df['PARCEL_ID'].to_numpy()}
+    for source_idx, boc_source in enumerate(boc_sources):
+        has_source_cols = ('source_dua_'+boc_source in df.columns) & ('source_far_'+boc_source in df.columns)
+        if has_source_cols:
+            columns['source_dua_'+boc_source] = df['source_dua_'+boc_source].to_numpy()
+        columns['allow_res_'   +boc_source] = capacity['allow_res'   ][source_idx]
+        columns['units_'       +boc_source] = capacity['units'       ][source_idx]
+        columns['allow_nonres_'+boc_source] = capacity['allow_nonres'][source_idx]
+        if has_source_cols:
+            columns['source_far_'+boc_source] = df['source_far_'+boc_source].to_numpy()
+        columns['sqft_'        +boc_source] = capacity['sqft'        ][source_idx]
+        columns['Ksqft_'       +boc_source] = capacity['Ksqft'       ][source_idx]
+        columns['emp_'         +boc_source] = capacity['emp'         ][source_idx]
+
+    return pd.DataFrame(columns, index=df.index)
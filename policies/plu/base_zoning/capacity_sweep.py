@@ -0,0 +1,270 @@
+USAGE = """
+  Sweep development capacity over every combination of
+    hybrid base zoning version (hybrid_index/*.csv plus the fill_naType base) x
+    PBA50 zoningmod scenario (zoning_mods_[mods].csv, plus 'none') x
+    nodev source (nodev_zmod, nodev_pba40)
+
+  The base parcel table (p10_plu_boc_fill_naType.csv from 2_dev_type_hybrid_modification.ipynb) is read once
+  into arrays and each (hybrid version, zoningmod scenario) is evaluated in a worker process.
+
+  Outputs, in output_dir:
+    capacity_sweep/                partitioned Parquet dataset of parcel-level capacity with
+                                   hybrid_version=*/zoningmod=*/nodev_source=* partitions
+    capacity_sweep_juris.parquet   jurisdiction rollup (also written as csv)
+    capacity_sweep_county.parquet  county rollup (also written as csv)
+
+  If --b10_file and --p10_file are passed, the net capacity classifications from net_capacity.py are added:
+  is_under_built and the zoned/existing ratios go into each parcel partition, and the zoning-independent
+  classifications (is_vacant, building_age, has_old_building, ILR) are written once to parcel_classification.parquet.
+
+"""
+
+import argparse, glob, itertools, logging, os, time
+import concurrent.futures
+import numpy as np
+import pandas as pd
+
+from capacity_engine import ALLOWED_BUILDING_TYPE_CODES, CAPACITY_ATTRIBUTES, capacity_from_arrays
+from hybrid_zoning import HYBRID_ATTRIBUTES, hybrid_index_matrix
+from net_capacity import classify_capacity, classify_parcels, existing_parcel_attributes
+from zoningmod_engine import apply_zoningmods, compile_zoningmods, read_zoningmods
+
+NOW = time.strftime("%Y_%m%d_%H%M")
+today = time.strftime('%Y_%m_%d')
+
+# default locations, set per user below; without them the paths must be passed on the command line
+hybrid_plu_boc_dir          = None
+pba50zoningmods_dir         = None
+data_output_dir             = None
+
+if os.getenv('USERNAME')    =='ywang':
+    BOX_dir                 = 'C:\\Users\\{}\\Box\\Modeling and Surveys\\Urban Modeling\\Bay Area UrbanSim 1.5\\PBA50'.format(os.getenv('USERNAME'))
+    GitHub_urbansim_dir     = 'C:\\Users\\{}\\Documents\\GitHub\\bayarea_urbansim'.format(os.getenv('USERNAME'))
+
+    # input file locations
+    hybrid_plu_boc_dir      = os.path.join(BOX_dir, 'Policies\\Base zoning\\outputs\\hybrid_base_zoning')
+    pba50zoningmods_dir     = os.path.join(GitHub_urbansim_dir, 'data')
+
+    # output file location
+    data_output_dir         = os.path.join(BOX_dir, 'Policies\\Base zoning\\outputs\\capacity')
+
+hybrid_index_dir            = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hybrid_index')
+
+# hybrid version with no hybrid index applied; BASIS zoning with missing allowed building types filled from PBA40
+BASE_HYBRID_VERSION = 'fill_naType'
+# zoningmod scenario meaning no zoningmods applied
+NO_ZONINGMOD        = 'none'
+# nodev_[source] columns in the base parcel table
+NODEV_SOURCES       = ['zmod','pba40']
+
+# base parcel arrays, set in each worker by init_worker(); base['existing'] holds existing building attributes if available
+BASE = None
+
+
+def load_base_arrays(plu_boc_file):
+    """
+    Read the base parcel table once and convert it to the arrays needed by the sweep.
+    Jurisdiction, county and pba50zoningmodcat are stored as categorical codes (-1 for missing)
+    along with their category names.
+    """
+    usecols = ['PARCEL_ID','ACRES','county_name','juris_zmod','pba50zoningmodcat_zmod'] + [
+               'nodev_'+nodev_source for nodev_source in NODEV_SOURCES] + [
+               'max_dua_basis','max_far_basis','max_dua_pba40','max_far_pba40'] + [
+               btype+'_basis' for btype in ALLOWED_BUILDING_TYPE_CODES] + [
+               btype+'_pba40' for btype in ALLOWED_BUILDING_TYPE_CODES]
+    df = pd.read_csv(plu_boc_file, usecols=usecols,
+                     dtype={'juris_zmod':str, 'county_name':str, 'pba50zoningmodcat_zmod':str})
+
+    base = {'PARCEL_ID': df['PARCEL_ID'].to_numpy(dtype=np.int64),
+            'ACRES'    : df['ACRES'].to_numpy(dtype=np.float64),
+            'nodev'    : np.stack([(df['nodev_'+nodev_source] == 1).to_numpy() for nodev_source in NODEV_SOURCES])}
+
+    for key, col in [('juris','juris_zmod'), ('county','county_name'), ('zmodcat','pba50zoningmodcat_zmod')]:
+        categorical = pd.Categorical(df[col])
+        base[key+'_code' ] = categorical.codes
+        base[key+'_names'] = list(categorical.categories)
+
+    for boc_source in ['basis','pba40']:
+        # allowed building types are 0/1 once missing is filled with 0, so int8 is enough
+        base['types_'  +boc_source] = df[[btype+'_'+boc_source for btype in ALLOWED_BUILDING_TYPE_CODES]].fillna(0).to_numpy(dtype=np.int8)
+        base['max_dua_'+boc_source] = df['max_dua_'+boc_source].to_numpy(dtype=np.float64)
+        base['max_far_'+boc_source] = df['max_far_'+boc_source].to_numpy(dtype=np.float64)
+
+    return base
+
+
+def read_hybrid_index(hybrid_idx_file, juris_names):
+    """
+    Read a hybrid index file and return a boolean array of shape (n_juris+1, len(HYBRID_ATTRIBUTES)),
+    true where the jurisdiction uses PBA40 rather than BASIS for that attribute (see hybrid_zoning.hybrid_index_matrix()).
+    """
+    return hybrid_index_matrix(pd.read_csv(hybrid_idx_file), juris_names)
+
+
+def apply_hybrid(base, use_pba40):
+    """
+    Returns (types, max_dua, max_far) for the hybrid version given by use_pba40 (from read_hybrid_index()).
+    If use_pba40 is None, returns the base BASIS zoning.
+    """
+    if use_pba40 is None:
+        return base['types_basis'], base['max_dua_basis'], base['max_far_basis']
+
+    parcel_use_pba40 = use_pba40[base['juris_code']]
+    n_types = len(ALLOWED_BUILDING_TYPE_CODES)
+    dua_idx = HYBRID_ATTRIBUTES.index('MAX_DUA')
+    far_idx = HYBRID_ATTRIBUTES.index('MAX_FAR')
+    types   = np.where(parcel_use_pba40[:, :n_types], base['types_pba40'],   base['types_basis'])
+    max_dua = np.where(parcel_use_pba40[:, dua_idx],  base['max_dua_pba40'], base['max_dua_basis'])
+    max_far = np.where(parcel_use_pba40[:, far_idx],  base['max_far_pba40'], base['max_far_basis'])
+    return types, max_dua, max_far
+
+
+def rollup(codes, names, capacity, nodev_idx, level):
+    """
+    Sum capacity for one nodev source by the given geography codes using bincount.
+    Returns dataframe with one row per name in names.
+    """
+    valid = codes >= 0
+    rollup_df = pd.DataFrame({level: names})
+    for attr in ['units','sqft','Ksqft','emp']:
+        rollup_df[attr] = np.bincount(codes[valid], weights=np.nan_to_num(capacity[attr][nodev_idx][valid]), minlength=len(names))
+    rollup_df['parcel_count'] = np.bincount(codes[valid], minlength=len(names))
+    return rollup_df
+
+
+def init_worker(base):
+    global BASE
+    BASE = base
+
+
+def sweep_task(hybrid_version, use_pba40, zoningmod, zoningmods, output_dir):
+    """
+    Evaluate capacity for one hybrid version and zoningmod scenario, for every nodev source.
+    Writes the parcel-level partitions and returns (juris rollup, county rollup).
+    """
+    base = BASE
+    types, max_dua, max_far = apply_hybrid(base, use_pba40)
+    if zoningmods is not None:
+        types, max_dua, max_far = apply_zoningmods(types, max_dua, max_far, base['zmodcat_code'], zoningmods)
+
+    # nodev sources are the stacked "source" axis of the capacity engine
+    n_nodev  = len(NODEV_SOURCES)
+    capacity = capacity_from_arrays(base['ACRES'], base['nodev'],
+                                    np.broadcast_to(types,   (n_nodev,) + types.shape),
+                                    np.broadcast_to(max_dua, (n_nodev,) + max_dua.shape),
+                                    np.broadcast_to(max_far, (n_nodev,) + max_far.shape))
+    # net capacity classifications for all nodev sources at once
+    classification = {}
+    if 'existing' in base:
+        classification = classify_capacity(base['existing'], capacity['units'], capacity['sqft'])
+
+    juris_rollups  = []
+    county_rollups = []
+    for nodev_idx, nodev_source in enumerate(NODEV_SOURCES):
+        partition_dir = os.path.join(output_dir, 'capacity_sweep',
+                                     'hybrid_version={}'.format(hybrid_version),
+                                     'zoningmod={}'.format(zoningmod),
+                                     'nodev_source={}'.format(nodev_source))
+        os.makedirs(partition_dir, exist_ok=True)
+
+        parcel_df = pd.DataFrame({'PARCEL_ID': base['PARCEL_ID']})
+        for attr in CAPACITY_ATTRIBUTES:
+            parcel_df[attr] = capacity[attr][nodev_idx]
+        for attr, values in classification.items():
+            parcel_df[attr] = values[nodev_idx]
+        parcel_df.to_parquet(os.path.join(partition_dir, 'part-0.parquet'), index=False)
+
+        for level, rollups in [('juris', juris_rollups), ('county', county_rollups)]:
+            rollup_df = rollup(base[level+'_code'], base[level+'_names'], capacity, nodev_idx, level)
+            rollup_df['hybrid_version'] = hybrid_version
+            rollup_df['zoningmod'     ] = zoningmod
+            rollup_df['nodev_source'  ] = nodev_source
+            rollups.append(rollup_df)
+
+    return pd.concat(juris_rollups), pd.concat(county_rollups)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter,)
+    parser.add_argument("--plu_boc_file",    help="Base parcel zoning (hybrid_0) file",
+                        required=hybrid_plu_boc_dir is None,
+                        default=os.path.join(hybrid_plu_boc_dir, today+'_p10_plu_boc_'+BASE_HYBRID_VERSION+'.csv') if hybrid_plu_boc_dir else None)
+    parser.add_argument("--hybrid_index_dir",help="Directory with hybrid index files", default=hybrid_index_dir)
+    parser.add_argument("--zoningmods_dir",  help="Directory with zoning_mods_[mods].csv files", default=pba50zoningmods_dir)
+    parser.add_argument("--mods",            help="Zoningmod scenarios to sweep, e.g. 21 22", nargs="*", default=[])
+    parser.add_argument("--b10_file",        help="Buildings file, for net capacity classifications", default=None)
+    parser.add_argument("--p10_file",        help="Parcels file with LAND_VALUE, for net capacity classifications", default=None)
+    parser.add_argument("--output_dir",      help="Output directory", required=data_output_dir is None, default=data_output_dir)
+    parser.add_argument("--workers",         help="Number of worker processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    if args.mods and not args.zoningmods_dir:
+        parser.error("--zoningmods_dir is required with --mods")
+
+    # create logger
+    logger = logging.getLogger(__name__)
+    logger.setLevel('DEBUG')
+
+    # console handler
+    ch = logging.StreamHandler()
+    ch.setLevel('INFO')
+    ch.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p'))
+    logger.addHandler(ch)
+    # file handler
+    fh = logging.FileHandler(os.path.join(args.output_dir,'capacity_sweep_{}.log'.format(NOW)), mode='w')
+    fh.setLevel('DEBUG')
+    fh.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p'))
+    logger.addHandler(fh)
+
+    base = load_base_arrays(args.plu_boc_file)
+    logger.info("Read {:,} parcels from {}".format(len(base['PARCEL_ID']), args.plu_boc_file))
+
+    # existing buildings for net capacity; rolled up to parcels once and shared with the workers
+    if args.b10_file and args.p10_file:
+        b10 = pd.read_csv(args.b10_file, dtype={'parcel_id':np.int64})
+        p10 = pd.read_csv(args.p10_file, usecols=['PARCEL_ID','LAND_VALUE'], dtype={'PARCEL_ID':np.float64, 'LAND_VALUE':np.float64})
+        logger.info("Read {:,} buildings from {} and {:,} parcels from {}".format(len(b10), args.b10_file, len(p10), args.p10_file))
+
+        base['existing'] = existing_parcel_attributes(b10, p10).reindex(base['PARCEL_ID'])
+        del b10, p10
+
+        parcel_classification = pd.DataFrame({'PARCEL_ID': base['PARCEL_ID']})
+        for col, values in classify_parcels(base['existing']).items():
+            parcel_classification[col] = values
+        parcel_classification.to_parquet(os.path.join(args.output_dir, 'parcel_classification.parquet'), index=False)
+        logger.info("Wrote parcel_classification.parquet; is_vacant:\n{}".format(parcel_classification['is_vacant'].value_counts()))
+
+    # hybrid versions
+    hybrid_versions = {BASE_HYBRID_VERSION: None}
+    for hybrid_idx_file in sorted(glob.glob(os.path.join(args.hybrid_index_dir, '*.csv'))):
+        hybrid_name = os.path.basename(hybrid_idx_file).split('.')[0][4:]
+        hybrid_versions[hybrid_name] = read_hybrid_index(hybrid_idx_file, base['juris_names'])
+    logger.info("Hybrid versions: {}".format(list(hybrid_versions.keys())))
+
+    # zoningmod scenarios
+    zoningmod_scenarios = {NO_ZONINGMOD: None}
+    for mods in args.mods:
+        zoningmods_file = os.path.join(args.zoningmods_dir, 'zoning_mods_'+mods+'.csv')
+        zoningmod_scenarios[mods] = compile_zoningmods(read_zoningmods(zoningmods_file), base['zmodcat_names'])
+    logger.info("Zoningmod scenarios: {}".format(list(zoningmod_scenarios.keys())))
+
+    juris_rollups  = []
+    county_rollups = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(base,)) as executor:
+        futures = {}
+        for (hybrid_version, use_pba40), (zoningmod, zoningmods) in itertools.product(hybrid_versions.items(),
+                                                                                      zoningmod_scenarios.items()):
+            future = executor.submit(sweep_task, hybrid_version, use_pba40, zoningmod, zoningmods, args.output_dir)
+            futures[future] = (hybrid_version, zoningmod)
+
+        for future in concurrent.futures.as_completed(futures):
+            juris_rollup, county_rollup = future.result()
+            juris_rollups.append(juris_rollup)
+            county_rollups.append(county_rollup)
+            logger.info("Completed hybrid_version={} zoningmod={}".format(*futures[future]))
+
+    for level, rollups in [('juris', juris_rollups), ('county', county_rollups)]:
+        rollup_df = pd.concat(rollups).sort_values(by=['hybrid_version','zoningmod','nodev_source',level])
+        rollup_df.to_parquet(os.path.join(args.output_dir, 'capacity_sweep_{}.parquet'.format(level)), index=False)
+        rollup_df.to_csv(    os.path.join(args.output_dir, today+'_capacity_sweep_{}.csv'.format(level)), index=False)
+        logger.info("Wrote {:,} {} rollup rows".format(len(rollup_df), level))
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+USAGE = """
+  Generate hybrid base zoning variants from the hybrid_0 base table (p10_plu_boc_fill_naType.csv) and a directory of
+  hybrid index files, applying all the index files concurrently.
+
+  The base table is read once and the zoning columns are written to .npy files which the worker processes memory-map,
+  so the parcel data is shared through the page cache rather than copied into each worker.
+
+  Each variant is written as a delta against the base, [hybrid_name].delta.parquet, with one row per
+  (PARCEL_ID, attribute) whose value the hybrid index changes, i.e. switched to a PBA40 value that differs from BASIS.
+  Use read_hybrid_variant() with the hybrid index to rebuild the full table, or pass --write_csv to also write the
+  full p10_plu_boc_[hybrid_name].csv.
+
+"""
+
+# Apply hybrid index files (hybrid_index/idx_*.csv) to parcel zoning.
+#
+# A hybrid index specifies, for each jurisdiction and zoning attribute (allowed building type or intensity),
+# whether to use BASIS or PBA40 data. Rather than masking all parcels once per (jurisdiction, attribute),
+# the index is turned into a long (juris, attribute) -> source table, pivoted to a small (juris x attribute)
+# boolean matrix and broadcast onto parcels with one categorical join on jurisdiction. Each attribute is then
+# selected with a single vectorized where, so applying a hybrid index is linear in parcels.
+
+import argparse, concurrent.futures, glob, os, shutil, tempfile, time
+import pandas as pd
+import numpy as np
+
+ALLOWED_BUILDING_TYPE_CODES = ["HS","HT","HM","OF","HO","SC","IL","IW","IH","RS","RB","MR","MT","ME"]
+INTENSITY_CODES             = ['MAX_DUA','MAX_FAR','MAX_HEIGHT']
+
+# attributes in the hybrid index, as [attribute]_idx columns
+HYBRID_ATTRIBUTES = ALLOWED_BUILDING_TYPE_CODES + INTENSITY_CODES
+# parcel column prefix for each attribute; parcel columns are [prefix]_basis and [prefix]_pba40
+ATTRIBUTE_COLUMN  = dict([(btype, btype) for btype in ALLOWED_BUILDING_TYPE_CODES] +
+                         [(intensity, intensity.lower()) for intensity in INTENSITY_CODES])
+
+# hybrid index values meaning "use PBA40"; older index files use 'PBA40'/'BASIS' while current ones use 0/1
+PBA40_INDEX_VALUES = [0, '0', 'PBA40']
+
+# label for BASIS allowed building types that were missing and filled from PBA40
+FILL_NA_LABEL = 'PBA40_fill_na'
+
+
+def hybrid_index_long(hybrid_idx):
+    """
+    Convert a hybrid index dataframe (one row per juris_name, one [attribute]_idx column per attribute)
+    to a long dataframe with columns juris_name, attribute, source where source is 'BASIS' or 'PBA40'.
+    """
+    if hybrid_idx.index.name == 'juris_name':
+        hybrid_idx = hybrid_idx.reset_index()
+
+    hybrid_long = hybrid_idx.melt(id_vars=['juris_name'],
+                                  value_vars=[attr+'_idx' for attr in HYBRID_ATTRIBUTES],
+                                  var_name='attribute', value_name='source')
+    hybrid_long['attribute'] = hybrid_long['attribute'].str[:-len('_idx')]
+    hybrid_long['source'   ] = np.where(hybrid_long['source'].isin(PBA40_INDEX_VALUES), 'PBA40', 'BASIS')
+    return hybrid_long
+
+
+def hybrid_index_matrix(hybrid_idx, juris_names):
+    """
+    Returns a boolean array of shape (len(juris_names)+1, len(HYBRID_ATTRIBUTES)), true where the jurisdiction
+    uses PBA40 for the attribute. Jurisdictions missing from the index use BASIS.
+    The extra last row is all false, so gathering with a categorical code of -1 (missing jurisdiction) keeps BASIS.
+    """
+    hybrid_long = hybrid_index_long(hybrid_idx)
+    hybrid_long['use_pba40'] = hybrid_long['source'] == 'PBA40'
+
+    use_pba40 = hybrid_long.pivot(index='juris_name', columns='attribute', values='use_pba40')
+    use_pba40 = use_pba40.reindex(index=juris_names, columns=HYBRID_ATTRIBUTES, fill_value=False).astype(bool).to_numpy()
+    return np.vstack([use_pba40, np.zeros((1, len(HYBRID_ATTRIBUTES)), dtype=bool)])
+
+
+def apply_hybrid_idx(df, hybrid_idx, juris_col='juris_zmod'):
+    """
+    Apply a hybrid index to parcel zoning.
+    Returns a copy of df with [attribute]_basis replaced by [attribute]_pba40 where the parcel's jurisdiction uses PBA40,
+    and an [attribute]_idx column for each attribute set to 'BASIS' or 'PBA40'.
+    If df already has [btype]_idx columns (e.g. 'PBA40_fill_na' from filling in missing BASIS types), those labels are kept.
+    """
+    juris = pd.Categorical(df[juris_col])
+    parcel_use_pba40 = hybrid_index_matrix(hybrid_idx, list(juris.categories))[juris.codes]
+
+    df_hybrid = df.copy()
+    for attr_idx, attr in enumerate(HYBRID_ATTRIBUTES):
+        col         = ATTRIBUTE_COLUMN[attr]
+        use_pba40   = parcel_use_pba40[:, attr_idx]
+        prior_label = df_hybrid[attr+'_idx'].to_numpy() if attr+'_idx' in df_hybrid.columns else 'BASIS'
+
+        df_hybrid[col+'_basis'] = np.where(use_pba40, df_hybrid[col+'_pba40'], df_hybrid[col+'_basis'])
+        df_hybrid[attr+'_idx' ] = np.where(use_pba40 & (prior_label != FILL_NA_LABEL), 'PBA40', prior_label)
+
+    return df_hybrid
+
+
+def write_base_memmap(df, memmap_dir, juris_col='juris_zmod'):
+    """
+    Write the zoning columns that hybrid indexes modify to .npy files in memmap_dir:
+      PARCEL_ID.npy, juris_code.npy, pba40.npy (n_parcels x n_attributes) and changes.npy (true where switching the
+      parcel attribute to PBA40 changes its value: the PBA40 value differs from BASIS and the attribute wasn't already
+      filled from PBA40, i.e. its [btype]_idx label isn't FILL_NA_LABEL).
+    Returns the jurisdiction names that juris_code indexes into.
+    """
+    juris = pd.Categorical(df[juris_col])
+    basis = df[[ATTRIBUTE_COLUMN[attr]+'_basis' for attr in HYBRID_ATTRIBUTES]].to_numpy(dtype=np.float64)
+    pba40 = df[[ATTRIBUTE_COLUMN[attr]+'_pba40' for attr in HYBRID_ATTRIBUTES]].to_numpy(dtype=np.float64)
+
+    # NaN in both is no change
+    changes = (pba40 != basis) & ~(np.isnan(pba40) & np.isnan(basis))
+    for attr_idx, attr in enumerate(HYBRID_ATTRIBUTES):
+        if attr+'_idx' in df.columns:
+            changes[:, attr_idx] &= (df[attr+'_idx'] != FILL_NA_LABEL).to_numpy()
+
+    np.save(os.path.join(memmap_dir, 'PARCEL_ID.npy'),  df['PARCEL_ID'].to_numpy())
+    np.save(os.path.join(memmap_dir, 'juris_code.npy'), juris.codes)
+    np.save(os.path.join(memmap_dir, 'pba40.npy'),      pba40)
+    np.save(os.path.join(memmap_dir, 'changes.npy'),    changes)
+    return list(juris.categories)
+
+
+def generate_hybrid_delta(hybrid_idx_file, memmap_dir, juris_names, output_file):
+    """
+    Apply one hybrid index file to the memory-mapped base arrays and write the variant as a delta:
+    PARCEL_ID, attribute, value for each parcel attribute switched to PBA40 whose value changes (see write_base_memmap()).
+    Returns (output_file, dict of attribute -> number of parcels whose value changes).
+    """
+    parcel_id  = np.load(os.path.join(memmap_dir, 'PARCEL_ID.npy'),  mmap_mode='r')
+    juris_code = np.load(os.path.join(memmap_dir, 'juris_code.npy'), mmap_mode='r')
+    changes    = np.load(os.path.join(memmap_dir, 'changes.npy'),    mmap_mode='r')
+    pba40      = np.load(os.path.join(memmap_dir, 'pba40.npy'),      mmap_mode='r')
+
+    use_pba40 = hybrid_index_matrix(pd.read_csv(hybrid_idx_file), juris_names)[juris_code] & changes
+    rows, attrs = np.nonzero(use_pba40)
+
+    delta = pd.DataFrame({'PARCEL_ID': parcel_id[rows],
+                          'attribute': pd.Categorical.from_codes(attrs, categories=HYBRID_ATTRIBUTES),
+                          'value'    : pba40[rows, attrs]})
+    delta.to_parquet(output_file, index=False)
+
+    counts = np.bincount(attrs, minlength=len(HYBRID_ATTRIBUTES))
+    return output_file, dict(zip(HYBRID_ATTRIBUTES, counts.tolist()))
+
+
+def read_hybrid_variant(df, delta, hybrid_idx, juris_col='juris_zmod'):
+    """
+    Rebuild a hybrid variant from the base table df, a delta written by generate_hybrid_delta() and the hybrid index
+    it was generated from (dataframes, or the paths to the delta parquet and index csv files).
+    The delta gives the values; the [attribute]_idx labels come from the hybrid index, since attributes switched to an
+    equal PBA40 value aren't in the delta.
+    Returns the same columns as apply_hybrid_idx().
+    """
+    if isinstance(delta, str):
+        delta = pd.read_parquet(delta)
+    if isinstance(hybrid_idx, str):
+        hybrid_idx = pd.read_csv(hybrid_idx)
+
+    juris = pd.Categorical(df[juris_col])
+    parcel_use_pba40 = hybrid_index_matrix(hybrid_idx, list(juris.categories))[juris.codes]
+
+    delta_row = pd.Index(df['PARCEL_ID']).get_indexer(delta['PARCEL_ID'])
+    delta_attribute = delta['attribute'].astype(str).to_numpy()
+    delta_value     = delta['value'].to_numpy()
+
+    df_hybrid = df.copy()
+    for attr_idx, attr in enumerate(HYBRID_ATTRIBUTES):
+        col         = ATTRIBUTE_COLUMN[attr]
+        in_attr     = delta_attribute == attr
+        values      = df_hybrid[col+'_basis'].to_numpy(dtype=np.float64, copy=True)
+        prior_label = df_hybrid[attr+'_idx'].to_numpy() if attr+'_idx' in df_hybrid.columns else 'BASIS'
+
+        values[delta_row[in_attr]] = delta_value[in_attr]
+        df_hybrid[col+'_basis'] = values
+        df_hybrid[attr+'_idx' ] = np.where(parcel_use_pba40[:, attr_idx] & (prior_label != FILL_NA_LABEL), 'PBA40', prior_label)
+
+    return df_hybrid
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter,)
+    parser.add_argument("base_file",        metavar="p10_plu_boc_fill_naType.csv", help="Base (hybrid_0) parcel zoning")
+    parser.add_argument("hybrid_index_dir", metavar="hybrid_index_dir",             help="Directory with idx_*.csv hybrid index files")
+    parser.add_argument("output_dir",       metavar="output_dir",                   help="Output directory")
+    parser.add_argument("--workers",        type=int, default=os.cpu_count(),       help="Number of worker processes")
+    parser.add_argument("--write_csv",      action="store_true",                    help="Also write the full csv for each variant")
+    args = parser.parse_args()
+
+    today = time.strftime('%Y_%m_%d')
+
+    base = pd.read_csv(args.base_file)
+    print("Read {:,} rows from {}".format(len(base), args.base_file))
+
+    hybrid_idx_files = sorted(glob.glob(os.path.join(args.hybrid_index_dir, '*.csv')))
+    memmap_dir = tempfile.mkdtemp(prefix='hybrid_base_', dir=args.output_dir)
+    try:
+        juris_names = write_base_memmap(base, memmap_dir)
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = {}
+            for hybrid_idx_file in hybrid_idx_files:
+                hybrid_name = os.path.basename(hybrid_idx_file).split('.')[0][4:]
+                output_file = os.path.join(args.output_dir, today+'_p10_plu_boc_'+hybrid_name+'.delta.parquet')
+                futures[executor.submit(generate_hybrid_delta, hybrid_idx_file, memmap_dir, juris_names, output_file)] = hybrid_idx_file
+
+            for future in concurrent.futures.as_completed(futures):
+                output_file, counts = future.result()
+                print("Wrote {}; parcel values changed to PBA40 by attribute: {}".format(output_file, counts))
+
+                if args.write_csv:
+                    csv_file = output_file.replace('.delta.parquet', '.csv')
+                    read_hybrid_variant(base, output_file, futures[future]).to_csv(csv_file, index=False)
+                    print("Wrote {}".format(csv_file))
+    finally:
+        shutil.rmtree(memmap_dir)
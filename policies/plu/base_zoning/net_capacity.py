@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Parcel classifications used to get from gross to net development capacity
+# (see 4_net_dev_capacity_calculation.ipynb):
+#  * is_vacant                        - no buildings, only vacant buildings, or no improvements/units/sqft (bool)
+#  * is_under_built_[source]          - zoned units less existing units and unit-equivalent non-res sqft
+#                                       is more than 50% of existing units (bool)
+#  * res_zoned_existing_ratio_[source], nonres_zoned_existing_ratio_[source]
+#                                     - existing residential units / non-res sqft over zoned (float)
+#  * building_age                     - age band of the oldest building (ordered categorical)
+#  * has_old_building                 - oldest building built before 1940 (bool)
+#  * ILR                              - investment (improvement value) to land value ratio; NaN where land value is 0 (float)
+#
+# Source-dependent classifications are computed for every zoning source at once from stacked (n_sources, n_parcels)
+# units/sqft arrays, so they can be applied directly to capacity_engine/capacity_sweep output.
+
+import pandas as pd
+import numpy as np
+
+from parcel_rollup import rollup_by_parcel
+
+SQUARE_FEET_PER_DU = 1200.0
+
+# share of existing units that additional units must exceed to call a parcel under-built
+UNDER_BUILT_RATIO  = 0.5
+
+# building development_type_id values that count as vacant
+# https://github.com/BayAreaMetro/petrale/blob/master/incoming/dv_buildings_det_type_lu.csv
+VACANT_DEVELOPMENT_TYPE_IDS = [0, 15]
+
+# building attributes rolled up to parcels
+BUILDING_AGGREGATIONS = {
+    'improvement_value'   :'sum',
+    'residential_units'   :'sum',
+    'residential_sqft'    :'sum',
+    'non_residential_sqft':'sum',
+    'building_sqft'       :'sum',
+    'redfin_sale_price'   :'sum',
+    'year_built'          :'min',
+    'building_id'         :'min',
+    'building_vacant'     :'all'}   # all buildings must be vacant to call this vacant
+
+# building_age bands based on the oldest building; parcels without year_built are 'missing'
+BUILDING_AGE_BINS   = [-np.inf, 1940, 1980, 2000, np.inf]
+BUILDING_AGE_LABELS = ['before 1940', '1940-1980', '1980-2000', 'after 2000']
+BUILDING_AGE_MISSING= 'missing'
+OLD_BUILDING_YEAR   = 1940
+
+
+def existing_parcel_attributes(buildings, parcels):
+    """
+    Roll up buildings (b10, with parcel_id and development_type_id) to parcels (p10, with PARCEL_ID and LAND_VALUE).
+    Returns dataframe aligned to parcels, indexed by PARCEL_ID, with BUILDING_AGGREGATIONS columns plus LAND_VALUE.
+    """
+    buildings = buildings.assign(building_vacant=buildings['development_type_id'].isin(VACANT_DEVELOPMENT_TYPE_IDS))
+    existing  = rollup_by_parcel(buildings, 'parcel_id', BUILDING_AGGREGATIONS, parcel_index=parcels['PARCEL_ID'])
+    existing['LAND_VALUE'] = parcels['LAND_VALUE'].to_numpy(dtype=np.float64)
+    return existing
+
+
+def classify_parcels(existing):
+    """
+    Zoning-independent classifications for the parcels in existing (from existing_parcel_attributes()).
+    Returns dict of is_vacant, building_age, has_old_building, ILR arrays.
+    """
+    is_vacant = pd.isnull(existing['building_id']).to_numpy() | existing['building_vacant'].to_numpy(dtype=bool)
+    no_improvements = np.ones(len(existing), dtype=bool)
+    for col in ['improvement_value','residential_units','residential_sqft','non_residential_sqft','building_sqft']:
+        no_improvements &= (existing[col] == 0).to_numpy()
+    is_vacant |= no_improvements
+
+    year_built   = existing['year_built'].to_numpy(dtype=np.float64)
+    building_age = pd.cut(year_built, bins=BUILDING_AGE_BINS, labels=BUILDING_AGE_LABELS, right=False)
+    building_age = building_age.add_categories([BUILDING_AGE_MISSING]).fillna(BUILDING_AGE_MISSING)
+
+    land_value = existing['LAND_VALUE'].to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ILR = np.where(land_value == 0, np.nan, existing['improvement_value'].to_numpy(dtype=np.float64) / land_value)
+
+    return {'is_vacant'       : is_vacant,
+            'building_age'    : building_age,
+            'has_old_building': year_built < OLD_BUILDING_YEAR,
+            'ILR'             : ILR}
+
+
+def classify_capacity(existing, units, sqft):
+    """
+    Zoning-dependent classifications. units and sqft are zoned capacity arrays of shape (n_parcels,)
+    or (n_sources, n_parcels), aligned with existing.
+    Returns dict of is_under_built, res_zoned_existing_ratio, nonres_zoned_existing_ratio arrays shaped like units.
+    """
+    residential_units    = existing['residential_units'   ].to_numpy(dtype=np.float64)
+    non_residential_sqft = existing['non_residential_sqft'].to_numpy(dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # additional units over existing units; parcels with no existing units but new units count as under-built
+        new_units = np.clip(units - residential_units - non_residential_sqft / SQUARE_FEET_PER_DU, 0, None)
+        ratio     = new_units / residential_units
+        ratio[np.isposinf(ratio)] = 1
+
+        res_ratio    = residential_units / units
+        # x/0 is 1 for positive x; negative x/0 (-inf) is clipped to 0 below, like the original clip(lower=0)
+        res_ratio[np.isposinf(res_ratio)] = 1
+        nonres_ratio = non_residential_sqft / sqft
+        nonres_ratio[np.isposinf(nonres_ratio)] = 1
+
+    return {'is_under_built'             : ratio > UNDER_BUILT_RATIO,
+            'res_zoned_existing_ratio'   : np.clip(res_ratio,    0, None),
+            'nonres_zoned_existing_ratio': np.clip(nonres_ratio, 0, None)}
+
+
+def net_capacity(capacity, existing, boc_sources):
+    """
+    Classify parcels for every boc_source in one pass.
+    capacity is parcel-level capacity with PARCEL_ID, units_[source] and sqft_[source] (e.g. from calculate_capacity_multi());
+    existing is from existing_parcel_attributes().
+    Returns capacity with the existing attributes and the classifications, with [source] suffixes for the
+    zoning-dependent ones.
+    """
+    existing = existing.reindex(capacity['PARCEL_ID'])
+
+    units = np.stack([capacity['units_'+boc_source].to_numpy(dtype=np.float64) for boc_source in boc_sources])
+    sqft  = np.stack([capacity['sqft_' +boc_source].to_numpy(dtype=np.float64) for boc_source in boc_sources])
+
+    net = capacity.copy()
+    for col in existing.columns:
+        net[col] = existing[col].to_numpy()
+    for col, values in classify_parcels(existing).items():
+        net[col] = values
+    for col, values in classify_capacity(existing, units, sqft).items():
+        for source_idx, boc_source in enumerate(boc_sources):
+            net[col+'_'+boc_source] = values[source_idx]
+
+    return net
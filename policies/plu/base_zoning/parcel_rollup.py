@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Roll up building-level attributes (e.g. b10 buildings) to parcels without a pandas groupby.
+#
+# Buildings are sorted by parcel once; each parcel's buildings are then a contiguous segment and every aggregate
+# is a single ufunc reduceat over the segment start offsets:
+#   'sum'   -> np.add.reduceat (missing values count as 0, as in pandas sum)
+#   'min'   -> np.fmin.reduceat (ignores missing values, as in pandas min)
+#   'max'   -> np.fmax.reduceat
+#   'all'   -> np.logical_and.reduceat, e.g. all buildings on the parcel are vacant
+#   'any'   -> np.logical_or.reduceat
+#   'count' -> number of buildings with a non-missing value
+
+import pandas as pd
+import numpy as np
+
+REDUCERS = {'sum': np.add,
+            'min': np.fmin,
+            'max': np.fmax,
+            'all': np.logical_and,
+            'any': np.logical_or}
+
+# value for parcels without buildings when the rollup is aligned to a parcel table
+NO_BUILDING_VALUES = {'sum'  : 0,
+                      'count': 0,
+                      'min'  : np.nan,
+                      'max'  : np.nan,
+                      'all'  : True,   # vacuously true, as with a product over no buildings
+                      'any'  : False}
+
+
+def parcel_segments(parcel_id):
+    """
+    Sort building parcel ids once.
+    Returns (order, parcel_ids, starts): order sorts the buildings by parcel, parcel_ids are the unique parcel ids
+    in sorted order and starts are the offsets in the sorted buildings where each parcel's segment starts.
+    """
+    order      = np.argsort(parcel_id, kind='stable')
+    sorted_ids = parcel_id[order]
+    starts     = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    return order, sorted_ids[starts], starts
+
+
+def rollup_by_parcel(buildings, parcel_col, aggregations, parcel_index=None):
+    """
+    Aggregate building columns to parcels.
+    aggregations is a dict of column -> one of 'sum', 'min', 'max', 'all', 'any', 'count'.
+    Buildings with a missing parcel id are dropped.
+    Returns a dataframe indexed by PARCEL_ID with one column per aggregation. If parcel_index is passed,
+    the result is aligned to those parcel ids and parcels without buildings get NO_BUILDING_VALUES.
+    """
+    parcel_id = buildings[parcel_col].to_numpy()
+    has_parcel = ~pd.isnull(parcel_id)
+    if not has_parcel.all():
+        buildings = buildings.loc[has_parcel]
+        parcel_id = parcel_id[has_parcel]
+
+    order, parcel_ids, starts = parcel_segments(parcel_id)
+
+    columns = {}
+    for col, how in aggregations.items():
+        values = buildings[col].to_numpy()[order]
+
+        if how == 'count':
+            columns[col] = np.add.reduceat(pd.notnull(values).astype(np.int64), starts) if len(starts) else np.zeros(0, dtype=np.int64)
+            continue
+
+        if how in ['all','any']:
+            values = values.astype(bool)
+        elif how == 'sum':
+            values = np.nan_to_num(values.astype(np.float64))
+        else:
+            values = values.astype(np.float64)
+
+        if len(starts):
+            columns[col] = REDUCERS[how].reduceat(values, starts)
+        else:
+            columns[col] = values[:0]
+
+    rolled_up = pd.DataFrame(columns, index=pd.Index(parcel_ids, name='PARCEL_ID'))
+    if parcel_index is None:
+        return rolled_up
+
+    # align to the parcel table: one gather per column, with NO_BUILDING_VALUES for parcels without buildings
+    parcel_index = pd.Index(parcel_index, name='PARCEL_ID')
+    position = rolled_up.index.get_indexer(parcel_index)
+    missing  = position < 0
+
+    aligned = {}
+    for col, how in aggregations.items():
+        values = rolled_up[col].to_numpy()
+        if how in ['sum','min','max']:
+            values = values.astype(np.float64)
+        gathered = np.full(len(parcel_index), NO_BUILDING_VALUES[how], dtype=values.dtype)
+        gathered[~missing] = values[position[~missing]]
+        aligned[col] = gathered
+
+    return pd.DataFrame(aligned, index=parcel_index)
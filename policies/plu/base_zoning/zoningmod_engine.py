@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Apply PBA50 zoningmod scenarios (bayarea_urbansim data/zoning_mods_[mods].csv) to parcel zoning.
+#
+# A zoningmods table is compiled once into override vectors indexed by pba50zoningmodcat:
+#  * type_override (n_categories x n_building_types): 1 to allow (add_bldg), 0 to disallow (drop_bldg), -1 for no change
+#  * dua_up / far_up:     raise max_dua / max_far to at least this value
+#  * dua_down / far_down: cap max_dua / max_far at this value
+# and applied to parcels with a single gather on the parcels' pba50zoningmodcat categorical codes,
+# so evaluating another scenario only costs compiling its (small) table.
+
+import re
+import pandas as pd
+import numpy as np
+
+from capacity_engine import ALLOWED_BUILDING_TYPE_CODES
+
+ZONINGMOD_COLUMNS  = ['pba50zoningmodcat','add_bldg','drop_bldg','dua_up','far_up','dua_down','far_down']
+INTENSITY_MODS     = ['dua_up','far_up','dua_down','far_down']
+
+# add_bldg/drop_bldg may list more than one building type
+BUILDING_TYPE_SEPARATOR = re.compile(r'[,;\s]+')
+
+
+def read_zoningmods(zoningmods_file):
+    """
+    Read the zoningmod columns from a zoning_mods_[mods].csv file.
+    """
+    return pd.read_csv(zoningmods_file, usecols=ZONINGMOD_COLUMNS)
+
+
+def parse_building_types(value):
+    """
+    Returns the list of building type codes in an add_bldg/drop_bldg value.
+    """
+    if pd.isnull(value):
+        return []
+    return [btype for btype in BUILDING_TYPE_SEPARATOR.split(str(value).strip()) if btype]
+
+
+def compile_zoningmods(zoningmods, categories):
+    """
+    Compile a zoningmods table into override vectors aligned with categories (the pba50zoningmodcat categories of the parcels).
+    Returns dict with type_override, dua_up, far_up, dua_down, far_down. Each has an extra last row with no
+    modification so that parcels with a missing pba50zoningmodcat (categorical code -1) are unchanged.
+    """
+    zoningmods = zoningmods.drop_duplicates(subset=['pba50zoningmodcat']).set_index('pba50zoningmodcat')
+    category_index = pd.Index(zoningmods.index).get_indexer(categories)
+    type_index     = dict((btype, idx) for idx, btype in enumerate(ALLOWED_BUILDING_TYPE_CODES))
+
+    # build the override rows for the zoningmods table, then gather them into category order
+    type_override = np.full((len(zoningmods)+1, len(ALLOWED_BUILDING_TYPE_CODES)), -1, dtype=np.int8)
+    for col, value in [('add_bldg',1), ('drop_bldg',0)]:
+        for row, bldg in enumerate(zoningmods[col].to_numpy()):
+            for btype in parse_building_types(bldg):
+                if btype not in type_index:
+                    raise ValueError("Unknown building type {} in {} for pba50zoningmodcat {}".format(
+                                     btype, col, zoningmods.index[row]))
+                type_override[row, type_index[btype]] = value
+
+    # categories not in the zoningmods table, and the trailing missing row, point at the last (no modification) row
+    gather = np.append(np.where(category_index < 0, len(zoningmods), category_index), len(zoningmods))
+
+    compiled = {'type_override': type_override[gather]}
+    for col in INTENSITY_MODS:
+        compiled[col] = np.append(zoningmods[col].to_numpy(dtype=np.float64), np.nan)[gather]
+    return compiled
+
+
+def apply_zoningmods(types, max_dua, max_far, zmodcat_code, compiled):
+    """
+    Apply compiled zoningmods to parcel zoning arrays.
+    types is (n_parcels, n_building_types); max_dua, max_far and zmodcat_code are (n_parcels,).
+    Returns new (types, max_dua, max_far).
+    """
+    type_override = compiled['type_override'][zmodcat_code]
+    types = np.where(type_override >= 0, type_override, types)
+
+    # fmax/fmin ignore NaN so parcels without a modification keep their zoning
+    max_dua = np.fmin(np.fmax(max_dua, compiled['dua_up'][zmodcat_code]), compiled['dua_down'][zmodcat_code])
+    max_far = np.fmin(np.fmax(max_far, compiled['far_up'][zmodcat_code]), compiled['far_down'][zmodcat_code])
+    return types, max_dua, max_far
+
+
+def apply_zoningmods_to_parcels(df, zoningmods, zmodcat_col='pba50zoningmodcat', type_suffix='',
+                                dua_col='max_dua', far_col='max_far'):
+    """
+    Apply a zoningmods table to a parcel zoning dataframe with allowed building type columns [btype][type_suffix],
+    dua_col, far_col and zmodcat_col.
+    Returns a copy of df with those columns modified.
+    """
+    zmodcat  = pd.Categorical(df[zmodcat_col])
+    compiled = compile_zoningmods(zoningmods, list(zmodcat.categories))
+
+    type_cols = [btype+type_suffix for btype in ALLOWED_BUILDING_TYPE_CODES]
+    types, max_dua, max_far = apply_zoningmods(df[type_cols].to_numpy(dtype=np.float64),
+                                               df[dua_col].to_numpy(dtype=np.float64),
+                                               df[far_col].to_numpy(dtype=np.float64),
+                                               zmodcat.codes, compiled)
+
+    df_mod = df.copy()
+    df_mod[type_cols] = types
+    df_mod[dua_col]   = max_dua
+    df_mod[far_col]   = max_far
+    return df_mod
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Dissolve parcels into one geometry per group (e.g. per pba50zoningmodcat) with a process pool.
+#
+#  * the group key is built with one groupby().ngroup() over the key columns rather than a row-wise string join
+#  * parcels are partitioned by (group, tile), where the optional tile column (e.g. jurisdiction) splits large groups
+#    so their unions run in parallel; each partition is unioned in a worker with shapely's union_all, or with
+#    coverage_union_all, which is much faster but only valid if the parcels don't overlap
+#  * groups split over several tiles are unioned again from their (few) tile pieces
+#
+# Requires shapely >= 2.0.
+
+import concurrent.futures, os
+import pandas as pd
+import numpy as np
+import geopandas as gpd
+import shapely
+
+# number of partitions sent to a worker at a time
+PARTITIONS_PER_TASK = 64
+
+
+def group_codes(df, by):
+    """
+    Returns (codes, groups): codes is the int group number of each row (missing values form their own groups)
+    and groups is a dataframe with the by columns for each group number.
+    """
+    by = by if isinstance(by, list) else [by]
+    codes = df.groupby(by, dropna=False, sort=True).ngroup().to_numpy()
+    _, first_row = np.unique(codes, return_index=True)
+    return codes, df[by].iloc[first_row].reset_index(drop=True)
+
+
+def partition_rows(codes, tile_codes=None):
+    """
+    Partition rows by group code (and tile code). Returns (partition_group, row_partitions) where row_partitions
+    is a list with the row positions of each partition and partition_group the group code of each partition.
+    """
+    if len(codes) == 0:
+        return codes, []
+    key = codes if tile_codes is None else codes.astype(np.int64) * (int(tile_codes.max()) + 2) + (tile_codes + 1)
+    order  = np.argsort(key, kind='stable')
+    starts = np.flatnonzero(np.r_[True, key[order][1:] != key[order][:-1]])
+    return codes[order[starts]], np.split(order, starts[1:])
+
+
+def union_partitions(geometries_list, method='union', grid_size=None):
+    """
+    Union each array of geometries in geometries_list. Runs in a worker process.
+    """
+    unioned = []
+    for geometries in geometries_list:
+        if method == 'coverage':
+            unioned.append(shapely.coverage_union_all(geometries))
+        else:
+            unioned.append(shapely.union_all(geometries, grid_size=grid_size))
+    return unioned
+
+
+def dissolve(gdf, by, tile_col=None, aggregations=None, method='union', grid_size=None, workers=None):
+    """
+    Dissolve gdf by the by column(s).
+    tile_col optionally splits groups into partitions that are unioned separately first.
+    aggregations is a dict of column -> pandas aggregation for the attribute columns, e.g. {'ACRES':'sum'}.
+    method is 'union' (with optional grid_size for precision snapping, which also closes slivers between parcels)
+    or 'coverage' (parcels that don't overlap).
+    Returns GeoDataFrame with one row per group: the by columns, parcel_count, the aggregations and the geometry.
+    """
+    gdf = gdf.loc[gdf.geometry.notnull() & ~gdf.geometry.is_empty]
+    codes, groups = group_codes(gdf, by)
+    tile_codes = pd.Categorical(gdf[tile_col]).codes if tile_col else None
+    partition_group, row_partitions = partition_rows(codes, tile_codes)
+
+    geometries = np.asarray(gdf.geometry)
+    tasks = [[geometries[rows] for rows in row_partitions[start:start+PARTITIONS_PER_TASK]]
+             for start in range(0, len(row_partitions), PARTITIONS_PER_TASK)]
+
+    pieces = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for unioned in executor.map(union_partitions, tasks, [method]*len(tasks), [grid_size]*len(tasks)):
+            pieces.extend(unioned)
+    pieces = np.array(pieces, dtype=object)
+
+    # groups split over tiles: union the tile pieces
+    geometry = np.empty(len(groups), dtype=object)
+    for group, group_pieces in zip(*partition_rows(partition_group)):
+        if len(group_pieces) == 1:
+            geometry[group] = pieces[group_pieces[0]]
+        elif method == 'coverage':
+            # tile pieces of a coverage are a coverage too
+            geometry[group] = shapely.coverage_union_all(pieces[group_pieces])
+        else:
+            geometry[group] = shapely.union_all(pieces[group_pieces], grid_size=grid_size)
+
+    dissolved = groups.copy()
+    dissolved['parcel_count'] = np.bincount(codes, minlength=len(groups))
+    if aggregations:
+        aggregated = gdf.drop(columns=gdf.geometry.name).groupby(codes).agg(aggregations)
+        for col in aggregations.keys():
+            dissolved[col] = aggregated[col].reindex(np.arange(len(groups))).to_numpy()
+    return gpd.GeoDataFrame(dissolved, geometry=geometry, crs=gdf.crs)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Write and read parcel geography layers as GeoParquet (WKB geometry) partitioned by county.
+#
+# Layout of a dataset directory:
+#   [county_col]=[value]/part-0.parquet - one file per county, rows sorted along a Hilbert curve and written in row groups
+#                                         with a GeoParquet 1.1 'bbox' covering column, so the row-group statistics
+#                                         carry bounding boxes and a bbox read only decodes the row groups it touches
+#   _partitions.json                    - partition values, row counts and bounds, so readers skip whole counties
+#
+# Unlike shapefiles there's no 2 GB or 10-character field name limit, and missing values stay null.
+# Requires geopandas >= 1.0 and pyarrow.
+
+import json, os, shutil
+import pandas as pd
+import numpy as np
+import geopandas as gpd
+
+PARTITIONS_FILE = '_partitions.json'
+ROW_GROUP_SIZE  = 50000
+
+
+def partition_value(value):
+    """
+    Normalise a partition value: integral floats and numpy integers (e.g. county_id 13.0 after a left join) become int.
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def partition_dir(dataset_dir, partition_col, value):
+    return os.path.join(dataset_dir, '{}={}'.format(partition_col, value))
+
+
+def write_geoparquet(gdf, dataset_dir, partition_col='county_id', row_group_size=ROW_GROUP_SIZE):
+    """
+    Write gdf to dataset_dir partitioned by partition_col (rows with a missing value go to a [partition_col]=null partition).
+    A float partition column with only integral values (e.g. county_id with NaN) is written as nullable Int64 and its
+    partitions are named by the int values. Any existing dataset_dir is replaced.
+    Returns the partition summary written to _partitions.json.
+    """
+    if os.path.exists(dataset_dir):
+        shutil.rmtree(dataset_dir)
+    os.makedirs(dataset_dir)
+
+    column = gdf[partition_col]
+    if pd.api.types.is_float_dtype(column) and (column.dropna() % 1 == 0).all():
+        gdf = gdf.assign(**{partition_col: column.astype('Int64')})
+
+    partitions = []
+    partition_values = gdf[partition_col].astype(object).where(gdf[partition_col].notnull(), 'null').map(partition_value)
+    for value, partition in gdf.groupby(partition_values, sort=True):
+        # spatially sorted rows make the row-group bounding boxes tight
+        # (parcels without a shape go last)
+        has_geometry = (partition.geometry.notnull() & ~partition.geometry.is_empty).to_numpy()
+        distance = np.full(len(partition), np.iinfo(np.int64).max, dtype=np.int64)
+        if has_geometry.any():
+            distance[has_geometry] = partition.loc[has_geometry].hilbert_distance().to_numpy()
+        partition = partition.iloc[np.argsort(distance, kind='stable')]
+
+        output_dir = partition_dir(dataset_dir, partition_col, value)
+        os.makedirs(output_dir)
+        partition.to_parquet(os.path.join(output_dir, 'part-0.parquet'), index=False,
+                             write_covering_bbox=True, row_group_size=row_group_size)
+
+        bounds = partition.total_bounds
+        partitions.append({'value' : value,
+                           'rows'  : len(partition),
+                           'bounds': None if np.isnan(bounds).any() else [float(bound) for bound in bounds]})
+
+    summary = {'partition_col': partition_col,
+               'crs'          : gdf.crs.to_string() if gdf.crs else None,
+               'partitions'   : partitions}
+    with open(os.path.join(dataset_dir, PARTITIONS_FILE), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def bounds_intersect(bounds, bbox):
+    return bounds is not None and not (bounds[0] > bbox[2] or bounds[2] < bbox[0] or bounds[1] > bbox[3] or bounds[3] < bbox[1])
+
+
+def read_geoparquet(dataset_dir, partitions=None, bbox=None, columns=None):
+    """
+    Read a dataset written by write_geoparquet().
+    partitions optionally limits the read to those partition values (e.g. county ids, compared as typed values so
+    1 and 1.0 match but '1' doesn't; 'null' for the missing value partition); bbox (minx, miny, maxx, maxy)
+    limits it to features intersecting the box, skipping counties and row groups outside it.
+    Returns GeoDataFrame with the partition column.
+    """
+    with open(os.path.join(dataset_dir, PARTITIONS_FILE)) as f:
+        summary = json.load(f)
+    partition_col = summary['partition_col']
+
+    selected = [partition_value(value) for value in partitions] if partitions is not None else None
+    frames = []
+    for partition in summary['partitions']:
+        if selected is not None and partition_value(partition['value']) not in selected:
+            continue
+        if bbox is not None and not bounds_intersect(partition['bounds'], bbox):
+            continue
+        gdf = gpd.read_parquet(os.path.join(partition_dir(dataset_dir, partition_col, partition['value']), 'part-0.parquet'),
+                               columns=columns, bbox=bbox)
+        # the covering column is only needed for the row-group statistics
+        gdf = gdf.drop(columns=['bbox'], errors='ignore')
+        if partition_col not in gdf.columns:
+            gdf[partition_col] = partition['value']
+        frames.append(gdf)
+
+    if not frames:
+        return gpd.GeoDataFrame(columns=(columns or []) + [partition_col, 'geometry'], geometry='geometry', crs=summary['crs'])
+    gdf = pd.concat(frames, ignore_index=True)
+    return gpd.GeoDataFrame(gdf, geometry=gdf.geometry.name, crs=summary['crs'])
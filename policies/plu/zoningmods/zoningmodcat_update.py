@@ -1,45 +1,31 @@
 # Notes:
 # Part 1 is to update the 'parcels_geography.csv' file with the new zoningmods and nodev attributes
-# Part 2 is to generate geospacial files to use in GIS. The output file dissolves parcels on 'pba50zoningmodcat', and contains "parcel count" and "total acres" for each dissolved geometry. The script enables two approaches for dissolving: 
+# Part 2 is to generate geospacial files to use in GIS. The output file dissolves parcels on 'pba50zoningmodcat', and contains "parcel count" and "total acres" for each dissolved geometry. The script enables two approaches for dissolving:
 #     1) Load the 'UrbanSim_input_Zoning\outputs\parcel_zoningmods.shp' into ArcGIS and dissolve.
-#     2) Dissolve in geopands and then export. 
+#     2) Dissolve in parallel with dissolve_engine and then export (--map --dissolve).
+#
+# Without --map or --geoparquet only the attribute table of p10_geo_shp.shp is read; with them it's read once, with the
+# parcel shapes, and Part 1 uses its attributes.
+# All joins are on geom_id (cast to int64 once) / juris_id indexes, and parcels_geography is also written as a typed parquet file.
 
+import argparse
 import pandas as pd
+import numpy as np
 import geopandas as gpd
 import os
 import fiona
 from datetime import datetime
 
+from dissolve_engine import dissolve
+from parcel_geoparquet import write_geoparquet
+
 if os.getenv('USERNAME')=='ywang':
     folder      = 'C:\\Users\\ywang\\Documents\\Files_for_Py\\UrbanSim_input_Zoning'
     input_dir   = os.path.join(folder, 'inputs')
     output_dir  = os.path.join(folder, 'outputs')
 
-## Input
-juris_raw = pd.read_csv(input_dir + '\\jurisId.csv')
-pg_old = pd.read_csv(input_dir + '\\07_11_2019_parcels_geography.csv')
-pba50_att_raw = pd.read_csv(input_dir + '\\p10_pba50_attr_20200416.csv')
-p10_geo = gpd.read_file(input_dir + '\\p10_geo_shp.shp')
-
-
-###############################################
-####### Update 'parcels_geography.csv' ########
-
-pba50_att = pba50_att_raw[['geom_id_s','pda_id', 'tpp_id', 'exp_id', 'exp_score', 'opp_id', 'zoningmodcat', 
-                           'perffoot', 'perfarea', 'mapshell', 'tpa_id', 'perfarea2', 'alt_zoning', 'zonetype', 'pubopp_id', 
-                           'puboppuse', 'juris_id', 'juris','hra_id', 'trich_id', 'cat_id', 'chcat', 'zoninghzcat', 
-                           'gg_id', 'tra_id', 'sesit_id', 'ppa_id', 'exp2020_id', 'pba50chcat', 'exsfd_id', 'chcatwsfd', 
-                           'pba50zoningmodcat', 'nodev']]
-pg_temp = pg_old[['Unnamed: 0','geom_id','urbanized']]
-juris = juris_raw[['jurisdiction_id','juris_id']]
-p10_geo.PARCEL_ID = p10_geo.PARCEL_ID.apply(lambda x: int(x))
-p10_geo.geom_id_s = p10_geo.geom_id_s.apply(lambda x: int(x))
-
-pg = pg_temp.merge(pba50_att, left_on = 'geom_id', right_on = 'geom_id_s', how = 'left').merge(
-    juris, on = 'juris_id', how = 'left').merge(p10_geo, on = 'geom_id_s', how = 'left')
-
-## check missing pba50zoningmod
-#print(pg.loc[pg.pba50zoningmodcat.isnull()].shape[0] == 0)
+## jurisdiction to county lookup, for the county partitions when p10_geo_shp has no county_id
+JURIS_COUNTY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'zones', 'jurisdictions', 'juris_county_id.csv')
 
 ## Parcel attribute:
 p_att = ['PARCEL_ID','geom_id','jurisdiction_id','juris_id','juris','ACRES']
@@ -53,67 +39,184 @@ hor_att = ['hra_id', 'trich_id', 'cat_id', 'zoninghzcat']
 ## PBA50 fields:
 pba50_att = ['gg_id', 'tra_id', 'sesit_id', 'ppa_id', 'exp2020_id', 'exsfd_id', 'pba50zoningmodcat', 'nodev','pba50chcat']
 
-## Today's date in output file name:
-today = datetime.today().strftime('%Y_%m_%d')
-
-## Export
-pg_csv_all = pg[p_att + pba40_att + hor_att + pba50_att]
-pg_csv_all.to_csv(output_dir + '\\'+today+'_parcels_geography.csv')
-
-pg_csv = pg[p_att + pba50_att]
-pg_csv.to_csv(output_dir + '\\'+today+'_parcels_geography_pba50_only.csv')
-
-
-####################################################
-### Generate 'parcel_zoningmods.shp' for mapping ###
-
-## select required fields
-pg_geo = gpd.GeoDataFrame(pg[p_att + pba50_att + ['geometry']], geometry='geometry')
-pg_geo[['ACRES']] = pg_geo[['ACRES']].fillna(value=0)
-for i in ['gg_id', 'tra_id', 'sesit_id', 'ppa_id', 'exp2020_id', 'exsfd_id']:
-    pg_geo[[i]] = pg_geo[[i]].fillna(value= 'NA')
-pg_geo = pg_geo.where(pd.notnull(pg_geo), None)
-pg_geo.to_file(output_dir + '\\'+today+'_parcel_zoningmods.shp')
-
-
-## create ['pba50zoningmodcat','pba50chcat'] file as a lookup file
-for_join = pg[['pba50zoningmodcat','pba50chcat']].drop_duplicates()
-print(for_join.shape)
-for_join.to_csv(output_dir + '\\'+today+'zoningmods_for_join.csv')
-
-## statistics around zoningmodcat
-stats = pg_geo[['PARCEL_ID','ACRES','pba50zoningmodcat']].groupby(['pba50zoningmodcat']).agg({'PARCEL_ID':'count', 'ACRES': 'sum'}).reset_index()
-stats = stats.merge(for_join, on = 'pba50zoningmodcat', how = 'left')
-stats.columns = ['pba50zoningmodcat', 'parcel_count','acres','pba50chcat']
-stats_nonZero = stats.query('parcel_count > 0 & acres > 0')
-print(stats_nonZero.shape)
-
-## create mapping file
-"""
-pg_geo['modTemp'] = pg_geo[['gg_id', 'tra_id', 'sesit_id', 'ppa_id']].apply(lambda row: '_'.join(row.values.astype(str)), axis=1)
-
-gdf = gpd.GeoDataFrame(pg_geo[['PARCEL_ID','modTemp','geometry']], geometry='geometry')
-print(gdf.shape)
-gdf2 = gdf.loc[gdf.geometry.notnull(),:]
-print(gdf2.shape)
-"""
-
-## dissolve by pba50zoningmodca
-"""
-gdf2['geometry'] = gdf2.buffer(0.01)
-try:
-    zoningmod_dis = gdf2.dissolve(by='modTemp',as_index=False)
-except:
-    print('error: ', gdf2.modTemp)
-
-display(zoningmod_dis.head())
-
-df = pd.DataFrame(zoningmod_dis, copy=True)
-df_split = pd.concat([df['modTemp'].str.split('_', expand=True), df['geometry'],df['PARCEL_ID']], axis=1)
-display(df_split.head())
-df_split.columns = ['juris_id', 'gg_id', 'tra_id', 'sesit_id', 'ppa_id', 'exp2020_id', 'exsfd_id', 'chcatwsfd','NA','geometry','PARCEL_ID']
-df_split = df_split.merge(juris_name[['jurisdiction','juris']], left_on = 'juris_id', right_on = 'juris',how = 'left')
-df_split.drop(columns = ['juris','juris_id'], inplace = True)
-dissolved = gpd.GeoDataFrame(df_split, geometry='geometry')
-dissolved.to_file(output_dir + '\\pba50_zoningmods_diss.shp')
-"""
+## pba50 attribute file fields used
+pba50_att_cols = ['geom_id_s','pda_id', 'tpp_id', 'exp_id', 'exp_score', 'opp_id', 'zoningmodcat',
+                  'perffoot', 'perfarea', 'mapshell', 'tpa_id', 'perfarea2', 'alt_zoning', 'zonetype', 'pubopp_id',
+                  'puboppuse', 'juris_id', 'juris','hra_id', 'trich_id', 'cat_id', 'chcat', 'zoninghzcat',
+                  'gg_id', 'tra_id', 'sesit_id', 'ppa_id', 'exp2020_id', 'pba50chcat', 'exsfd_id', 'chcatwsfd',
+                  'pba50zoningmodcat', 'nodev']
+
+## overlay ids with 'NA' for missing in the shapefile
+overlay_id_att = ['gg_id', 'tra_id', 'sesit_id', 'ppa_id', 'exp2020_id', 'exsfd_id']
+
+
+def read_p10(p10_geo_file, geometry=False):
+    """
+    Read p10_geo_shp.shp with integer PARCEL_ID and geom_id_s. Without geometry, only the attribute table is read.
+    """
+    if geometry:
+        p10 = gpd.read_file(p10_geo_file)
+    else:
+        p10 = pd.DataFrame(gpd.read_file(p10_geo_file, ignore_geometry=True))
+    for col in ['PARCEL_ID','geom_id_s']:
+        p10[col] = p10[col].astype(np.int64)
+    return p10
+
+
+def build_parcels_geography(pg_old, pba50_att_raw, juris_raw, p10):
+    """
+    Join the old parcels_geography (for geom_id and urbanized), the pba50 attributes, jurisdiction ids and the p10
+    parcel attributes on integer indexes.
+    Returns parcels_geography with the index of pg_old.
+    """
+    pg_temp = pg_old[['Unnamed: 0','geom_id','urbanized']]
+    pba50   = pba50_att_raw[pba50_att_cols].astype({'geom_id_s':np.int64}).set_index('geom_id_s')
+    juris   = juris_raw[['jurisdiction_id','juris_id']].set_index('juris_id')
+    p10_att = p10[['geom_id_s','PARCEL_ID','ACRES']].set_index('geom_id_s')
+
+    pg = pg_temp.join(pba50, on='geom_id', how='left')
+    pg = pg.join(juris, on='juris_id', how='left')
+    pg = pg.join(p10_att, on='geom_id', how='left')
+    return pg
+
+
+def write_parcels_geography(pg, output_dir, today):
+    """
+    Write [today]_parcels_geography.csv, [today]_parcels_geography_pba50_only.csv and the typed [today]_parcels_geography.parquet
+    (string attributes as categoricals).
+    """
+    pg_all = pg[p_att + pba40_att + hor_att + pba50_att]
+    pg_all.to_csv(os.path.join(output_dir, today+'_parcels_geography.csv'))
+    pg_all[p_att + pba50_att].to_csv(os.path.join(output_dir, today+'_parcels_geography_pba50_only.csv'))
+
+    pg_typed = pg_all.copy()
+    for col in pg_typed.columns:
+        if pg_typed[col].dtype == object:
+            pg_typed[col] = pg_typed[col].astype('category')
+    pg_typed.to_parquet(os.path.join(output_dir, today+'_parcels_geography.parquet'), index=False)
+
+
+def zoningmodcat_stats(pg):
+    """
+    Returns (for_join, stats): the ['pba50zoningmodcat','pba50chcat'] lookup, and parcel count and acres by pba50zoningmodcat.
+    """
+    for_join = pg[['pba50zoningmodcat','pba50chcat']].drop_duplicates()
+
+    stats = pg.groupby(['pba50zoningmodcat']).agg({'PARCEL_ID':'count', 'ACRES': 'sum'}).reset_index()
+    stats = stats.merge(for_join, on = 'pba50zoningmodcat', how = 'left')
+    stats.columns = ['pba50zoningmodcat', 'parcel_count','acres','pba50chcat']
+    return for_join, stats
+
+
+def parcel_zoningmods_geo(pg, p10_geo):
+    """
+    Attach parcel shapes (p10_geo, from read_p10(geometry=True)) to the parcels_geography fields used for mapping,
+    plus county_id if p10_geo has it.
+    Returns GeoDataFrame.
+    """
+    p10_cols = ['geom_id_s','geometry'] + (['county_id'] if 'county_id' in p10_geo.columns else [])
+    pg_geo = pg[p_att + pba50_att].join(p10_geo[p10_cols].set_index('geom_id_s'), on='geom_id', how='left')
+    return gpd.GeoDataFrame(pg_geo, geometry='geometry', crs=p10_geo.crs)
+
+
+def add_county_id(pg_geo, juris_county_file=JURIS_COUNTY_FILE):
+    """
+    Add county_id from the parcels' juris_id (via juris_county_id.csv) if pg_geo doesn't have it.
+    Raises ValueError if no parcel gets a county; reports parcels without one (they go to the null partition).
+    """
+    if 'county_id' in pg_geo.columns:
+        return pg_geo
+    juris_county = pd.read_csv(juris_county_file, usecols=['juris_id','county_id']).drop_duplicates(subset=['juris_id'])
+    pg_geo = pg_geo.copy()
+    pg_geo['county_id'] = pg_geo['juris_id'].map(juris_county.set_index('juris_id')['county_id']).astype('Int64')
+
+    missing = pg_geo['county_id'].isnull()
+    if missing.all():
+        raise ValueError("No parcel juris_id matched {}; can't partition by county".format(juris_county_file))
+    if missing.any():
+        print("{:,} parcels have no county for juris_id {}".format(missing.sum(), sorted(pg_geo.loc[missing, 'juris_id'].dropna().unique())))
+    return pg_geo
+
+
+def parcel_zoningmods_shp(pg_geo):
+    """
+    Fill missing values the way the parcel_zoningmods.shp shapefile needs them.
+    """
+    pg_geo = pg_geo.copy()
+    pg_geo['ACRES'] = pg_geo['ACRES'].fillna(value=0)
+    pg_geo[overlay_id_att] = pg_geo[overlay_id_att].fillna(value='NA')
+
+    # fiona wants None rather than NaN for missing values in text fields; numeric fields take NaN
+    for col in pg_geo.columns:
+        if col != 'geometry' and pg_geo[col].dtype == object:
+            pg_geo[col] = pg_geo[col].where(pg_geo[col].notnull(), None)
+    return pg_geo
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Update parcels_geography with the PBA50 zoningmods and nodev attributes")
+    parser.add_argument("--map", action="store_true", help="Also load parcel shapes and write parcel_zoningmods.shp for mapping")
+    parser.add_argument("--geoparquet", action="store_true", help="Also load parcel shapes and write parcel_zoningmods as GeoParquet partitioned by county")
+    parser.add_argument("--dissolve", action="store_true", help="With --map, also write parcels dissolved by pba50zoningmodcat")
+    parser.add_argument("--grid_size", type=float, default=0.01, help="Precision grid for the dissolve union")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of dissolve worker processes")
+    args = parser.parse_args()
+
+    ## Today's date in output file name:
+    today = datetime.today().strftime('%Y_%m_%d')
+
+    ## Input
+    juris_raw = pd.read_csv(os.path.join(input_dir, 'jurisId.csv'))
+    pg_old = pd.read_csv(os.path.join(input_dir, '07_11_2019_parcels_geography.csv'))
+    pba50_att_raw = pd.read_csv(os.path.join(input_dir, 'p10_pba50_attr_20200416.csv'))
+    p10_geo_file = os.path.join(input_dir, 'p10_geo_shp.shp')
+
+
+    ###############################################
+    ####### Update 'parcels_geography.csv' ########
+
+    # read once: with shapes if Part 2 needs them, otherwise only the attribute table
+    if args.map or args.geoparquet:
+        p10_geo = read_p10(p10_geo_file, geometry=True)
+        p10 = pd.DataFrame(p10_geo.drop(columns=p10_geo.geometry.name))
+    else:
+        p10 = read_p10(p10_geo_file)
+
+    pg = build_parcels_geography(pg_old, pba50_att_raw, juris_raw, p10)
+
+    ## check missing pba50zoningmod
+    #print(pg.loc[pg.pba50zoningmodcat.isnull()].shape[0] == 0)
+
+    ## Export
+    write_parcels_geography(pg, output_dir, today)
+
+    ## create ['pba50zoningmodcat','pba50chcat'] file as a lookup file
+    for_join, stats = zoningmodcat_stats(pg)
+    print(for_join.shape)
+    for_join.to_csv(os.path.join(output_dir, today+'zoningmods_for_join.csv'))
+
+    ## statistics around zoningmodcat
+    stats_nonZero = stats.query('parcel_count > 0 & acres > 0')
+    print(stats_nonZero.shape)
+
+
+    ####################################################
+    ### Generate 'parcel_zoningmods.shp' for mapping ###
+
+    if args.map or args.geoparquet:
+        pg_geo = parcel_zoningmods_geo(pg, p10_geo)
+
+    ## GeoParquet, partitioned by county (from juris_id if p10_geo_shp has no county_id)
+    if args.geoparquet:
+        write_geoparquet(add_county_id(pg_geo), os.path.join(output_dir, today+'_parcel_zoningmods_geoparquet'), partition_col='county_id')
+
+    if args.map:
+        parcel_zoningmods_shp(pg_geo).to_file(os.path.join(output_dir, today+'_parcel_zoningmods.shp'))
+
+        ## dissolve by pba50zoningmodcat, partitioned by jurisdiction
+        if args.dissolve:
+            zoningmod_dis = dissolve(pg_geo, by='pba50zoningmodcat', tile_col='juris',
+                                     aggregations={'ACRES':'sum'}, grid_size=args.grid_size, workers=args.workers)
+            zoningmod_dis = zoningmod_dis.merge(for_join.drop_duplicates(subset=['pba50zoningmodcat']), on = 'pba50zoningmodcat', how = 'left')
+            zoningmod_dis.rename(columns={'ACRES':'acres'}).to_file(os.path.join(output_dir, today+'_pba50_zoningmods_diss.shp'))